@@ -1,18 +1,47 @@
 '''file pipeline:
 Main.py
     split_link.py
-    convert_to_links.sh
-    ffmpeg (copy .mp4)
-    ffmpeg (convert .mp3)
+    convert_to_links.py
+    preflight.py (warn if the token expires before the download would finish)
+    download_segments.py
+        ffmpeg (copy .mp4, convert .mp3 and the optional speech audio in one pass)
+        audio_chunker.py (optional: transcribe while downloading)
+    verify_segments.py (.mp4 length vs playlist)
+    library.py (skip VODs already archived, ingest the outputs)
+    telemetry.py (every stage -> run_log.jsonl)
 '''
 
 
 # TODO: TEST print statements
-# TODO: add auto indexing (in set variables section)
 
 # Imports
-import subprocess
-from split_link import set_variables
+import os
+
+from split_link import VodUrl, set_variables, output_names, next_output_index
+from convert_to_links import convert_to_links
+from download_segments import convert_speech, download_media, speech_name
+from preflight import TokenSigner, preflight, format_preflight
+from verify_segments import verify_mp4
+from library import Library
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+from telemetry import RunLog, file_size, print_progress
+
+# Number of .ts segments fetched at the same time
+download_workers = 8
+# Verified segments are kept here so an interrupted download only fetches what is missing;
+# a VOD's segments are deleted once its .mp4 matches the playlist (audio-only runs keep them)
+segment_cache_dir = "segment_cache"
+# "both": .mp4 and .mp3 from one download, "video": .mp4 only, "audio": .mp3 only
+output_mode = "both"
+# Also write 16 kHz mono audio for transcription: None, "opus", "flac" or "pcm" (.wav)
+speech_profile = None
+speech_loudnorm = False
+# Transcribe to .srt while the download is still running (needs whisper installed locally)
+live_transcription = False
+# Per-stage timings, bytes and exit codes are appended here
+run_log = RunLog("run_log.jsonl")
+# Finished outputs are ingested here; a VOD that is already in it is not downloaded again
+library = Library("library")
 
 # [Manual] Download m3u8
 # [Manual] Move m3u8 to parent directory
@@ -23,30 +52,128 @@ print(f"\n>>> received input URL: {file_url}")
 
 # Set variables
 year = "2024"
-base_url, input_m3u8, auth_token, month_num, date = set_variables(file_url)
-output_m3u8 = "output_m3u8_" + input_m3u8
-output_mp4 = "output_mp4_" + date + ".mp4"    # RENAME HERE FOR MORE SAME-DAY FILES TODO: add auto indexing
-output_mp3 = "output_mp3_" + date + ".mp3"    # RENAME HERE FOR MORE SAME-DAY FILES 
+with run_log.stage("set_variables"):
+    base_url, input_m3u8, auth_token, month_num, date = set_variables(file_url)
+    output_m3u8 = "output_m3u8_" + input_m3u8
+    vod_id = input_m3u8[:-len(".m3u8")]
+
+# Already archived: the outputs keep the same-day index they were archived with, so the library is checked
+# before a new index is taken; outputs still here are reported, missing ones copied back (no network)
+def names_for_index(index):
+    names = output_names(date, next_output_index(date) if index is None else index)
+    return dict(zip((".mp4", ".mp3"), names))
+
+extensions = [extension for extension, mode in ((".mp4", "video"), (".mp3", "audio")) if output_mode in ("both", mode)]
+with run_log.stage("library_restore"):
+    archived = library.restore_outputs(vod_id, extensions, names_for_index)
+if archived:
+    output_mp4, output_mp3 = archived[0][".mp4"], archived[0][".mp3"]
+else:
+    output_mp4, output_mp3 = output_names(date, next_output_index(date))    # same-day files get (1), (2), ...
+output_speech = speech_name(output_mp3, speech_profile) if speech_profile else None
 print("\n" + "="*50)
 print("\n-----> following variables set:\nbase_url, input_m3u8, auth_token, month_num, date,\noutput_m3u8, output_mp4, and output_mp3\n\n\n")
 
+wanted = [path for path, mode in ((output_mp4, "video"), (output_mp3, "audio")) if output_mode in ("both", mode)]
+if archived:
+    for path, action in archived[1]:
+        if action == "in place":
+            print(f"\n-----> {path} already here (archived in {library.root})")
+        else:
+            print(f"\n-----> {path} restored from {library.root} (already downloaded)")
+    # The speech audio is restored too, or made from the restored file if this VOD never had one
+    if output_speech:
+        speech_entry = library.lookup(vod_id, "." + output_speech.rsplit(".", 1)[1])
+        if speech_entry and os.path.exists(output_speech) and os.path.getsize(output_speech) == speech_entry["size"]:
+            print(f"\n-----> {output_speech} already here (archived in {library.root})")
+        elif speech_entry:
+            print(f"\n-----> {library.restore(speech_entry, output_speech)} restored from {library.root}")
+        else:
+            with run_log.stage("speech_audio", profile=speech_profile) as stage:
+                stage.returncode = convert_speech(wanted[0], output_speech, speech_profile, speech_loudnorm)
+                stage.bytes_in, stage.bytes_out = file_size(wanted[0]), file_size(output_speech)
+            if stage.returncode != 0:
+                raise SystemExit(f"\n-----> ffmpeg exited with {stage.returncode}, see {run_log.path}")
+            library.ingest_files([output_speech], vod_id)
+            print(f"\n-----> {output_speech} created")
+    library.close()
+    raise SystemExit(0)
+
 # Convert .ts to links
 print("\n-----> converting .ts to links")
-subprocess.run(["bash", "convert_to_links.sh", base_url, input_m3u8, auth_token, output_m3u8])
+with run_log.stage("playlist_rewrite") as stage:
+    playlist = convert_to_links(base_url, input_m3u8, auth_token, output_m3u8)
+    stage.bytes_in, stage.bytes_out, stage.segments = file_size(input_m3u8), file_size(output_m3u8), len(playlist)
 print("\n" + "="*50)
 print(f"\n-----> {output_m3u8} created\n\n\n")
 
-# Download .mp4
-print(f"\n-----> downloading .mp4")
-subprocess.run(["ffmpeg", "-protocol_whitelist", "https,file,crypto,data,tcp,tls", "-i", output_m3u8, "-c", "copy", output_mp4])
-print("\n" + "="*50)
-print(f"\n-----> {output_mp4} created\n\n\n")
+# Check the token expiry against the estimated download time
+def ask_for_refreshed_url():
+    return input("\nToken expired, enter a refreshed m3u8 URL for the same VOD: ").strip() or None
+
+signer = TokenSigner(VodUrl.parse(file_url), refresh=ask_for_refreshed_url)
+with run_log.stage("preflight") as stage:
+    check = preflight(playlist, signer, download_workers, segment_cache_dir)
+print(f"\n-----> preflight: {format_preflight(check)}")
+if not check["ok"]:
+    new_url = input("\nEnter a refreshed m3u8 URL (empty to start anyway): ").strip()
+    if new_url:
+        signer.vod_url = VodUrl.parse(new_url)
 
-# Create mp3
-print("\n-----> converting an .mp3")
-subprocess.run(["ffmpeg", "-i", output_mp4, "-q:a", "0", "-map", "a", output_mp3])
+# Download .mp4 and create .mp3
+print(f"\n-----> downloading ({output_mode})")
+transcription = None
+if live_transcription:
+    from audio_chunker import StreamingTranscription, WhisperTranscriber
+    output_srt = output_mp3[:-len(".mp3")] + ".srt"
+    transcription = StreamingTranscription(WhisperTranscriber(), output_srt)
+# One ffmpeg pass does the remux and the audio extract, so they are logged as one stage
+with run_log.stage("download_remux_audio", mode=output_mode) as stage:
+    stats = download_media(
+        playlist,
+        output_mp4 if output_mode in ("both", "video") else None,
+        output_mp3 if output_mode in ("both", "audio") else None,
+        download_workers,
+        segment_cache_dir,
+        transcription.feed if transcription else None,
+        print_progress,
+        signer,
+        output_speech,
+        speech_profile,
+        speech_loudnorm,
+    )
+    stage.bytes_in, stage.segments, stage.returncode = stats["bytes"], stats["segments"], stats["returncode"]
+    stage.bytes_out = file_size(output_mp4, output_mp3, output_speech)
+if stats["returncode"] != 0:
+    raise SystemExit(f"\n-----> ffmpeg exited with {stats['returncode']}, see {run_log.path}")
+# A broken .mp4 (and the audio from the same pass) is archived as unverified so the rerun rebuilds it
+unverified = []
+if output_mode in ("both", "video"):
+    problems, _ = verify_mp4(output_mp4, playlist)
+    if problems:
+        unverified = [output_mp4, output_mp3, output_speech]
+        print(f"\n-----> {output_mp4} does not match the playlist: {'; '.join(problems)}")
+        print(f"\n-----> run: python verify_segments.py {output_m3u8} --repair, then Main.py again")
+    elif playlist.uris:
+        # Verified: the cached segments are a second copy of the .mp4, only kept for --repair
+        freed = SegmentCache(segment_cache_dir, vod_id_from_name(segment_name(playlist.uris[0]))).clear()
+        print(f"\n-----> {segment_cache_dir} cleared for {vod_id} ({freed / 1e9:.2f} GB)")
+if transcription:
+    transcription.close()
+    print(f"\n-----> {output_srt} created")
 print("\n" + "="*50)
-print(f"\n-----> {output_mp3} created\n\n\n")
+if output_mode in ("both", "video"):
+    print(f"\n-----> {output_mp4} created")
+if output_mode in ("both", "audio"):
+    print(f"\n-----> {output_mp3} created")
+if output_speech:
+    print(f"\n-----> {output_speech} created")
+with run_log.stage("library_ingest") as stage:
+    library.ingest_files([output_m3u8] + wanted + [output_speech] + ([output_srt] if transcription else []), vod_id,
+                         unverified=unverified)
+    stage.bytes_in = file_size(*wanted)
+library.close()
+print("\n\n")
 
 # [Manual] Upload mp4 to YouTube
 # https://studio.youtube.com/channel/@KkuraFIMLY
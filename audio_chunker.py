@@ -0,0 +1,175 @@
+'''file pipeline:
+audio_chunker.py (runs while download_segments.py is still downloading)
+    ffmpeg (.ts segments -> 16 kHz mono PCM)
+    PcmChunker (30 s chunks, 1 s overlap)
+    bounded queue (download waits when the transcriber falls behind)
+    transcriber -> .srt, appended chunk by chunk
+'''
+
+
+# Imports
+import queue
+import subprocess
+import threading
+from collections import namedtuple
+
+from subtitles import format_srt_cue
+
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2    # s16le mono
+
+AudioChunk = namedtuple("AudioChunk", ["index", "start_ms", "pcm", "last"])
+
+
+# Any object with transcribe(pcm, sample_rate) -> [(start_s, end_s, text), ...]
+# (times relative to the start of the chunk) can be used, e.g. a stub in tests
+
+class WhisperTranscriber:
+    def __init__(self, model_name="large-v3", language=None):
+        import numpy
+        import whisper
+        self._numpy = numpy
+        self.model = whisper.load_model(model_name)
+        self.language = language
+
+    def transcribe(self, pcm, sample_rate):
+        audio = self._numpy.frombuffer(pcm, self._numpy.int16).astype(self._numpy.float32) / 32768.0
+        result = self.model.transcribe(audio, language=self.language)
+        return [(segment["start"], segment["end"], segment["text"].strip()) for segment in result["segments"]]
+
+
+# Decode (part of) an audio/video file to the PCM format the transcribers take
+
+def decode_pcm(path, start=None, duration=None):
+    command = ["ffmpeg", "-loglevel", "error"]
+    if start is not None:
+        command += ["-ss", f"{start:.3f}"]
+    if duration is not None:
+        command += ["-t", f"{duration:.3f}"]
+    command += ["-i", path, "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+    return subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+
+
+# Cut a PCM byte stream into fixed-length chunks; consecutive chunks share `overlap_seconds`
+# so words on a chunk border are heard completely by at least one of them.
+# A full chunk is held back until the next one is cut (or the stream ends), so the final
+# chunk always goes out with last=True and keeps the cues in its closing overlap
+
+class PcmChunker:
+    def __init__(self, emit, chunk_seconds=30, overlap_seconds=1, sample_rate=SAMPLE_RATE):
+        if not 0 <= overlap_seconds < chunk_seconds:
+            raise ValueError("overlap_seconds must be smaller than chunk_seconds")
+        self.emit = emit
+        self.sample_rate = sample_rate
+        self.chunk_bytes = int(chunk_seconds * sample_rate) * BYTES_PER_SAMPLE
+        self.step_bytes = self.chunk_bytes - int(overlap_seconds * sample_rate) * BYTES_PER_SAMPLE
+        self.buffer = bytearray()
+        self.index = 0
+        self.offset_bytes = 0
+        self.held = None    # (pcm, offset_bytes) of the newest full chunk
+
+    def _emit(self, pcm, offset_bytes, last):
+        start_ms = offset_bytes // BYTES_PER_SAMPLE * 1000 // self.sample_rate
+        self.emit(AudioChunk(self.index, start_ms, pcm, last))
+        self.index += 1
+
+    def feed(self, pcm):
+        self.buffer += pcm
+        while len(self.buffer) >= self.chunk_bytes:
+            if self.held is not None:
+                self._emit(*self.held, False)
+            self.held = (bytes(self.buffer[:self.chunk_bytes]), self.offset_bytes)
+            del self.buffer[:self.step_bytes]
+            self.offset_bytes += self.step_bytes
+
+    def finish(self):
+        # The rest after the last full chunk is only new audio if it is longer than the overlap
+        overlap_bytes = self.chunk_bytes - self.step_bytes
+        tail = len(self.buffer) > overlap_bytes or (self.held is None and self.buffer)
+        if self.held is not None:
+            self._emit(*self.held, not tail)
+        if tail:
+            self._emit(bytes(self.buffer), self.offset_bytes, True)
+        elif self.held is None:
+            self.emit(None)
+        self.held = None
+        self.buffer.clear()
+
+
+# Each chunk keeps the cues starting in its own half of the overlaps, so a line
+# heard by two chunks is written once
+
+def keep_cues(chunk, cues, overlap_ms, chunk_ms):
+    low = chunk.start_ms + (overlap_ms // 2 if chunk.index else 0)
+    high = chunk.start_ms + chunk_ms - overlap_ms // 2
+    kept = []
+    for start_s, end_s, text in cues:
+        start_ms = chunk.start_ms + int(start_s * 1000)
+        end_ms = chunk.start_ms + int(end_s * 1000)
+        if text and low <= start_ms and (chunk.last or start_ms < high):
+            kept.append((start_ms, end_ms, text))
+    return kept
+
+
+class StreamingTranscription:
+    def __init__(self, transcriber, output_srt, chunk_seconds=30, overlap_seconds=1, max_queued_chunks=4):
+        self.transcriber = transcriber
+        self.output_srt = output_srt
+        self.chunk_ms = int(chunk_seconds * 1000)
+        self.overlap_ms = int(overlap_seconds * 1000)
+        self.chunks = queue.Queue(max_queued_chunks)
+        self.chunker = PcmChunker(self._put_chunk, chunk_seconds, overlap_seconds)
+        self.cue_count = 0
+        self.error = None
+
+        self.ffmpeg = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-f", "mpegts", "-i", "pipe:0",
+             "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self._reader = threading.Thread(target=self._read_pcm, daemon=True)
+        self._worker = threading.Thread(target=self._transcribe_chunks, daemon=True)
+        self._reader.start()
+        self._worker.start()
+
+    def _put_chunk(self, chunk):
+        # Blocks while the queue is full: ffmpeg's stdout fills up, then its stdin,
+        # and the download's on_segment waits until the transcriber catches up
+        self.chunks.put(chunk)
+
+    def _read_pcm(self):
+        for block in iter(lambda: self.ffmpeg.stdout.read(64 * 1024), b""):
+            self.chunker.feed(block)
+        self.chunker.finish()
+
+    def _transcribe_chunks(self):
+        with open(self.output_srt, "w", encoding="utf-8") as f:
+            while True:
+                chunk = self.chunks.get()
+                if chunk is None:
+                    break
+                try:
+                    cues = self.transcriber.transcribe(chunk.pcm, SAMPLE_RATE)
+                except Exception as error:
+                    self.error = error
+                    cues = []
+                for start_ms, end_ms, text in keep_cues(chunk, cues, self.overlap_ms, self.chunk_ms):
+                    self.cue_count += 1
+                    f.write(format_srt_cue(self.cue_count, start_ms, end_ms, text))
+                f.flush()
+                if chunk.last:
+                    break
+
+    # Same signature as download_segments' on_segment
+    def feed(self, index, data):
+        self.ffmpeg.stdin.write(data)
+
+    def close(self):
+        self.ffmpeg.stdin.close()
+        self._reader.join()
+        self._worker.join()
+        self.ffmpeg.wait()
+        if self.error is not None:
+            raise self.error
+        return self.cue_count
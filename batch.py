@@ -0,0 +1,273 @@
+'''file pipeline:
+batch.py (non-interactive Main.py for many URLs)
+    read one JSON line per job: {"url": "<m3u8 URL>", "mode": "both" | "video" | "audio", "ignore_expiry": false}
+    per job:
+        split_link.py (same-day indices assigned without collisions)
+        library.py (VOD already archived: same-day index kept, missing outputs copied back, skip the rest)
+        convert_to_links.py
+        preflight.py            (fail early if the token expires before the download would finish)
+        download_segments.py    (at most --max-downloads at a time, signed with the job's token)
+        ffmpeg (convert .mp3)   (at most --max-transcodes at a time)
+        verify_segments.py      (.mp4 matches the playlist: the VOD's segment_cache/ entries are deleted)
+        library.py (ingest the outputs)
+    batch_summary.json, run_log.jsonl (telemetry.py)
+
+usage:
+    python batch.py urls.jsonl
+    python batch.py - < urls.jsonl
+'''
+
+
+# Imports
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from split_link import VodUrl, set_variables, output_names, next_output_index
+from convert_to_links import convert_to_links
+from download_segments import DEFAULT_WORKERS, ConnectionPool, fetch_segment, download_media, convert_mp3
+from preflight import TokenSigner, format_preflight, preflight
+from telemetry import RunLog, file_size
+from library import Library
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+from verify_segments import verify_mp4
+
+
+MODES = ("both", "video", "audio")
+
+
+def read_jobs(lines):
+    jobs = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        job = json.loads(line)
+        if "url" not in job:
+            raise ValueError(f"line {line_number}: missing \"url\"")
+        job.setdefault("mode", "both")
+        if job["mode"] not in MODES:
+            raise ValueError(f"line {line_number}: \"mode\" must be one of {', '.join(MODES)}, not {job['mode']!r}")
+        job.setdefault("ignore_expiry", False)
+        job["id"] = len(jobs) + 1
+        jobs.append(job)
+    return jobs
+
+
+class Scheduler:
+    def __init__(self, output_dir=".", max_downloads=2, max_transcodes=1,
+                 workers=DEFAULT_WORKERS, cache_dir="segment_cache", run_log=None, library_dir=None):
+        self.output_dir = output_dir
+        self.run_log = run_log or RunLog()
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.library_dir = library_dir
+        self.downloads = threading.BoundedSemaphore(max_downloads)
+        self.transcodes = threading.BoundedSemaphore(max_transcodes)
+        self._names_lock = threading.Lock()
+        self._taken = set()
+
+    # Output names are reserved under a lock so two jobs for the same day never share an index
+    def reserve_names(self, date, index=None):
+        # index: the same-day index an archived VOD already has; None takes the next free one
+        with self._names_lock:
+            if index is None:
+                index = next_output_index(date, self.output_dir, self._taken)
+            names = output_names(date, index)
+            self._taken.update(names)
+        return [os.path.join(self.output_dir, name) for name in names]
+
+    def run(self, jobs):
+        # One thread per job; the semaphores are what limit the work
+        with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as executor:
+            list(executor.map(self.run_job, jobs))
+        return jobs
+
+    def run_job(self, job):
+        job["status"] = "running"
+        job["timings"] = {}
+        start = time.perf_counter()
+        try:
+            self._run_stages(job)
+            job["status"] = "done"
+        except Exception as error:
+            job["status"] = "failed"
+            job["error"] = f"{type(error).__name__}: {error}"
+        job["timings"]["total"] = round(time.perf_counter() - start, 3)
+        return job
+
+    @contextmanager
+    def _stage(self, job, name):
+        start = time.perf_counter()
+        try:
+            with self.run_log.stage(name, job=job["id"]) as stage:
+                yield stage
+        finally:
+            job["timings"][name] = round(time.perf_counter() - start, 3)
+
+    def _run_stages(self, job):
+        with self._stage(job, "set_variables"):
+            base_url, input_m3u8, auth_token, month_num, date = set_variables(job["url"])
+        output_m3u8 = os.path.join(self.output_dir, "output_m3u8_" + input_m3u8)
+        want_mp4 = job["mode"] in ("both", "video")
+        want_mp3 = job["mode"] in ("both", "audio")
+        vod_id = input_m3u8[:-len(".m3u8")]
+        # The library is checked before a same-day index is taken: an archived VOD keeps its index
+        extensions = [extension for extension, wanted in ((".mp4", want_mp4), (".mp3", want_mp3)) if wanted]
+        if self.library_dir and self._restore(job, vod_id, date, extensions):
+            return
+        output_mp4, output_mp3 = self.reserve_names(date)
+        job["outputs"] = [path for path, wanted in ((output_mp4, want_mp4), (output_mp3, want_mp3)) if wanted]
+
+        # Use the manually downloaded playlist if it is there, fetch it otherwise
+        if not os.path.exists(input_m3u8):
+            input_m3u8 = os.path.join(self.output_dir, input_m3u8)
+            with self._stage(job, "fetch_m3u8") as stage:
+                fetch_input_m3u8(job["url"], input_m3u8)
+                stage.bytes_in = file_size(input_m3u8)
+        with self._stage(job, "playlist_rewrite") as stage:
+            playlist = convert_to_links(base_url, input_m3u8, auth_token, output_m3u8)
+            stage.bytes_in, stage.bytes_out, stage.segments = file_size(input_m3u8), file_size(output_m3u8), len(playlist)
+
+        # No one is there to paste a refreshed URL: an expired token fails the job (the segments fetched so far
+        # stay in the cache), and a token that would expire mid-download fails it before the download starts
+        signer = TokenSigner(VodUrl.parse(job["url"]))
+
+        # Encode the .mp3 during the download only if a transcode slot is free right now,
+        # otherwise copy the .mp4 and queue the .mp3 for later so downloads are never held up.
+        # Audio-only jobs always encode: they wait for a transcode slot before taking a download slot
+        single_pass = not want_mp4 and self.transcodes.acquire()
+        try:
+            with self.downloads:
+                with self._stage(job, "preflight"):
+                    check = preflight(playlist, signer, self.workers, self.cache_dir)
+                job["preflight"] = format_preflight(check)
+                if not check["ok"] and not job["ignore_expiry"]:
+                    raise RuntimeError(f"{job['preflight']}; queue it again with a fresh URL "
+                                       "(or \"ignore_expiry\": true)")
+                if want_mp4:
+                    single_pass = want_mp3 and self.transcodes.acquire(blocking=False)
+                with self._stage(job, "download") as stage:
+                    stats = download_media(
+                        playlist,
+                        output_mp4 if want_mp4 else None,
+                        output_mp3 if single_pass else None,
+                        self.workers, self.cache_dir,
+                        signer=signer,
+                    )
+                    stage.bytes_in, stage.segments, stage.returncode = stats["bytes"], stats["segments"], stats["returncode"]
+                    stage.bytes_out = file_size(output_mp4, output_mp3)
+        finally:
+            if single_pass:
+                self.transcodes.release()
+        job["segments"] = stats["segments"]
+        job["bytes"] = stats["bytes"]
+        if stats["returncode"] != 0:
+            raise RuntimeError(f"ffmpeg exited with {stats['returncode']}")
+
+        if want_mp3 and want_mp4 and not single_pass:
+            with self.transcodes, self._stage(job, "audio_extract") as stage:
+                stage.returncode = convert_mp3(output_mp4, output_mp3)
+                stage.bytes_in, stage.bytes_out = file_size(output_mp4), file_size(output_mp3)
+            if stage.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with {stage.returncode}")
+
+        if want_mp4:
+            # A verified .mp4 makes the cached segments a second copy, a broken one keeps them for --repair
+            with self._stage(job, "verify"):
+                job["problems"], _ = verify_mp4(output_mp4, playlist)
+            if not job["problems"] and playlist.uris:
+                SegmentCache(self.cache_dir, vod_id_from_name(segment_name(playlist.uris[0]))).clear()
+
+        if self.library_dir:
+            # One connection per call: jobs run on their own threads
+            library = Library(self.library_dir)
+            try:
+                with self._stage(job, "library_ingest") as stage:
+                    library.ingest_files([output_m3u8] + job["outputs"], vod_id,
+                                         unverified=job["outputs"] if job.get("problems") else ())
+                    stage.bytes_in = file_size(*job["outputs"])
+            finally:
+                library.close()
+
+    def _restore(self, job, vod_id, date, extensions):
+        if not extensions:
+            return False
+
+        def names_for_index(index):
+            return dict(zip((".mp4", ".mp3"), self.reserve_names(date, index)))
+
+        library = Library(self.library_dir)
+        try:
+            with self._stage(job, "library_restore"):
+                archived = library.restore_outputs(vod_id, extensions, names_for_index)
+        finally:
+            library.close()
+        if not archived:
+            return False
+        job["outputs"] = [path for path, _ in archived[1]]
+        job["restored"] = True
+        job["already_here"] = [path for path, action in archived[1] if action == "in place"]
+        return True
+
+
+def fetch_input_m3u8(file_url, input_m3u8):
+    pool = ConnectionPool()
+    try:
+        data = fetch_segment(pool, file_url)
+    finally:
+        pool.close()
+    with open(input_m3u8, "wb") as f:
+        f.write(data)
+
+
+def print_summary(jobs):
+    print("\n" + "="*50)
+    for job in jobs:
+        outputs = ", ".join(os.path.basename(path) for path in job.get("outputs", []))
+        line = f"[{job['id']}] {job['status']:<7} {job['timings'].get('total', 0):>8.1f} s  {outputs}"
+        if "error" in job:
+            line += f"  ({job['error']})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download many Weverse m3u8 URLs without prompts")
+    parser.add_argument("queue", help="file with one JSON job per line, or - for stdin")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--max-downloads", type=int, default=2)
+    parser.add_argument("--max-transcodes", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="segments fetched at once per download")
+    parser.add_argument("--cache-dir", default="segment_cache")
+    parser.add_argument("--summary", default="batch_summary.json")
+    parser.add_argument("--run-log", default="run_log.jsonl")
+    parser.add_argument("--library", default="library", help="archive checked before and filled after each job")
+    args = parser.parse_args()
+
+    if args.queue == "-":
+        jobs = read_jobs(sys.stdin)
+    else:
+        with open(args.queue, encoding="utf-8") as f:
+            jobs = read_jobs(f)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    scheduler = Scheduler(args.output_dir, args.max_downloads, args.max_transcodes, args.workers, args.cache_dir,
+                          RunLog(args.run_log), args.library)
+    scheduler.run(jobs)
+
+    print_summary(jobs)
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(jobs, f, ensure_ascii=False, indent=4)
+    print(f"\n-----> {args.summary} created")
+
+    if any(job["status"] != "done" for job in jobs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+'''
+Benchmark: archive .mp3 (-q:a 0) vs the 16 kHz mono speech profiles
+encode time, file size, decode to transcriber PCM and (optionally) Whisper time per output.
+
+    python benchmarks/bench_audio_profiles.py [input.mp4|.mp3] [--minutes 10] [--loudnorm] [--transcribe turbo]
+
+Without an input a synthetic stereo 48 kHz track is generated with ffmpeg (lavfi).
+'''
+
+
+# Imports
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from audio_chunker import SAMPLE_RATE, decode_pcm
+from download_segments import SPEECH_PROFILES, speech_args
+
+
+def write_synthetic_input(path, minutes):
+    # Tones with pauses and some noise, stereo 48 kHz like the live audio
+    expression = "0.3*sin(2*PI*220*t)*lt(mod(t,7),5)+0.05*random(0)"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", f"aevalsrc='{expression}|{expression}':s=48000:d={minutes * 60}",
+                    "-c:a", "aac", "-b:a", "160k", path], check=True)
+
+
+def encode(input_path, output, args):
+    start = time.perf_counter()
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", input_path, "-map", "a", "-vn"] + args + [output],
+                   check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", nargs="?")
+    parser.add_argument("--minutes", type=float, default=10, help="length of the synthetic input")
+    parser.add_argument("--loudnorm", action="store_true", help="add loudness normalization to the speech profiles")
+    parser.add_argument("--transcribe", metavar="MODEL", help="also time Whisper on every output")
+    args = parser.parse_args()
+
+    transcriber = None
+    if args.transcribe:
+        from audio_chunker import WhisperTranscriber
+        transcriber = WhisperTranscriber(args.transcribe)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = args.input
+        if input_path is None:
+            input_path = os.path.join(tmp, "input.m4a")
+            write_synthetic_input(input_path, args.minutes)
+
+        profiles = [("archive mp3", ".mp3", ["-q:a", "0"])]
+        profiles += [(name, extension, speech_args(name, args.loudnorm)) for name, (extension, _) in SPEECH_PROFILES.items()]
+
+        print(f"{'profile':<12} {'encode s':>9} {'size MB':>9} {'decode s':>9} {'whisper s':>10}")
+        for name, extension, ffmpeg_args in profiles:
+            output = os.path.join(tmp, name.replace(" ", "_") + extension)
+            encode_seconds = encode(input_path, output, ffmpeg_args)
+            size = os.path.getsize(output)
+
+            start = time.perf_counter()
+            pcm = decode_pcm(output)
+            decode_seconds = time.perf_counter() - start
+
+            whisper = ""
+            if transcriber is not None:
+                start = time.perf_counter()
+                transcriber.transcribe(pcm, SAMPLE_RATE)
+                whisper = f"{time.perf_counter() - start:.1f}"
+            print(f"{name:<12} {encode_seconds:>9.2f} {size / 1e6:>9.2f} {decode_seconds:>9.2f} {whisper:>10}")
+
+
+if __name__ == "__main__":
+    main()
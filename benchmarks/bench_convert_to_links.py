@@ -0,0 +1,63 @@
+'''
+Micro-benchmark: convert_to_links.sh vs convert_to_links.py
+on a synthetic 50k-segment playlist.
+
+    python benchmarks/bench_convert_to_links.py [segments]
+'''
+
+
+# Imports
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from convert_to_links import convert_to_links
+
+BASE_URL = "https://weverse-rmcnmv.akamaized.net/c/read/v2/VOD_ALPHA/weverse_2024_10_11_0/hls/"
+AUTH_TOKEN = "?__gda__=1728690709_b50f5db0d36d3dd9a668304473cbeafe"
+VOD_ID = "f6f2c258-87a6-11ef-80a1-a0369ffac330"
+
+
+def write_synthetic_playlist(path, segments):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-TARGETDURATION:4\n")
+        for i in range(segments):
+            f.write(f"#EXTINF:4.000000,\n{VOD_ID}-{i:06d}.ts\n")
+        f.write("#EXT-X-ENDLIST\n")
+
+
+def main():
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_m3u8 = os.path.join(tmp, VOD_ID + ".m3u8")
+        write_synthetic_playlist(input_m3u8, segments)
+        print(f"synthetic playlist: {segments} segments, {os.path.getsize(input_m3u8) / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        playlist = convert_to_links(BASE_URL, input_m3u8, AUTH_TOKEN, os.path.join(tmp, "py.m3u8"))
+        py_seconds = time.perf_counter() - start
+        print(f"convert_to_links.py: {py_seconds:.3f} s ({len(playlist)} segments, {playlist.total_duration:.0f} s of video)")
+
+        if shutil.which("bash") is None:
+            print("convert_to_links.sh: skipped (bash not found)")
+            return
+
+        start = time.perf_counter()
+        subprocess.run(["bash", os.path.join(ROOT, "convert_to_links.sh"), BASE_URL, input_m3u8, AUTH_TOKEN,
+                        os.path.join(tmp, "sh.m3u8")], check=True)
+        sh_seconds = time.perf_counter() - start
+        print(f"convert_to_links.sh: {sh_seconds:.3f} s ({sh_seconds / py_seconds:.0f}x slower)")
+
+        with open(os.path.join(tmp, "py.m3u8"), "rb") as a, open(os.path.join(tmp, "sh.m3u8"), "rb") as b:
+            print("outputs identical:", a.read() == b.read())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+'''
+Benchmark: read, clean up and write every file in archive-subtitle with subtitles.py
+
+    python benchmarks/bench_subtitles.py [directory]
+'''
+
+
+# Imports
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from subtitles import read_subtitles, apply_passes, format_srt_cue
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "archive-subtitle")
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith((".srt", ".vtt")))
+
+    cues_in = cues_out = 0
+    start = time.perf_counter()
+    for path in paths:
+        table = read_subtitles(path)
+        result = apply_passes(table)
+        output = io.StringIO()
+        for number, (start_ms, end_ms, text) in enumerate(result, 1):
+            output.write(format_srt_cue(number, start_ms, end_ms, text))
+        cues_in += len(table)
+        cues_out += len(result)
+    seconds = time.perf_counter() - start
+
+    print(f"{len(paths)} files, {cues_in} cues -> {cues_out} cues in {seconds * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+'''file pipeline:
+chat_index.py (after get_live_messages.py)
+    live_chat.ndjson -> per-second message counts (+ keyword counts), prefix sums
+    queries: top N spikes, messages between t1 and t2
+    SubtitleEdit bookmarks (.SE.bookmarks) for the cues at the spikes
+
+usage:
+    python chat_index.py live_chat.ndjson --top 10 [--keywords ㅋㅋ,lol] [--bookmarks output_mp3_2024_October_23.srt]
+'''
+
+
+# Imports
+import argparse
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+
+from subtitles import read_subtitles, format_timestamp
+
+
+# Fields of a chat message (first one present is used)
+TIME_KEYS = ("messageTime", "createdAt", "time")
+TEXT_KEYS = ("content", "message", "text")
+
+
+def _first(message, keys, default=None):
+    for key in keys:
+        if key in message:
+            return message[key]
+    return default
+
+
+def read_messages(ndjson_path):
+    # Returns [(epoch_ms, text), ...] sorted by time
+    messages = []
+    with open(ndjson_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            epoch_ms = _first(message, TIME_KEYS)
+            if epoch_ms is not None:
+                messages.append((int(epoch_ms), str(_first(message, TEXT_KEYS, ""))))
+    messages.sort()
+    return messages
+
+
+class ChatIndex:
+    def __init__(self, messages, start_ms=None, keywords=()):
+        # messages: sorted [(epoch_ms, text)]; times are kept relative to start_ms (default: first message)
+        if start_ms is None:
+            start_ms = messages[0][0] if messages else 0
+        self.start_ms = start_ms
+        self.times = array("q", (epoch_ms - start_ms for epoch_ms, _ in messages))
+        self.texts = [text for _, text in messages]
+
+        seconds = max(0, self.times[-1] // 1000 + 1) if self.times else 0
+        self.counts = array("I", bytes(4 * seconds))
+        self.keyword_counts = {keyword: array("I", bytes(4 * seconds)) for keyword in keywords}
+        for time_ms, text in zip(self.times, self.texts):
+            if time_ms < 0:
+                continue
+            second = time_ms // 1000
+            self.counts[second] += 1
+            for keyword, counts in self.keyword_counts.items():
+                if keyword in text:
+                    counts[second] += 1
+
+        # prefix[i] = messages in seconds [0, i), so any range count is one subtraction
+        self.prefix = array("Q", [0])
+        total = 0
+        for count in self.counts:
+            total += count
+            self.prefix.append(total)
+        self._ranked = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def count_between(self, t1, t2):
+        # Messages in seconds [t1, t2)
+        t1 = min(max(int(t1), 0), len(self.counts))
+        t2 = min(max(int(t2), t1), len(self.counts))
+        return self.prefix[t2] - self.prefix[t1]
+
+    def messages_between(self, t1, t2):
+        low = bisect_left(self.times, int(t1 * 1000))
+        high = bisect_right(self.times, int(t2 * 1000))
+        return [(self.times[i], self.texts[i]) for i in range(low, high)]
+
+    def _ranking(self, window):
+        # Seconds ordered by messages in the window starting there; computed once per window size
+        ranking = self._ranked.get(window)
+        if ranking is None:
+            scores = [self.prefix[min(second + window, len(self.counts))] - self.prefix[second]
+                      for second in range(len(self.counts))]
+            ranking = self._ranked[window] = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        return ranking
+
+    def top_spikes(self, n=10, window=10, min_distance=60):
+        # [(second, messages in window)], at least min_distance seconds apart
+        spikes = []
+        for second in self._ranking(window):
+            if len(spikes) == n:
+                break
+            if all(abs(second - chosen) >= min_distance for chosen, _ in spikes):
+                spikes.append((second, self.count_between(second, second + window)))
+        return spikes
+
+
+def write_bookmarks(spikes, subtitle_path, bookmarks_path=None):
+    # SubtitleEdit bookmarks point at cue indices (0-based) of the subtitle file
+    table = read_subtitles(subtitle_path)
+    bookmarks = {}
+    for second, count in spikes:
+        idx = max(0, bisect_right(table.starts, second * 1000) - 1)
+        if idx < len(table) and idx not in bookmarks:
+            bookmarks[idx] = f"chat spike: {count} messages"
+
+    bookmarks_path = bookmarks_path or subtitle_path + ".SE.bookmarks"
+    entries = ",".join(json.dumps({"idx": idx, "txt": txt}, ensure_ascii=False, separators=(",", ":"))
+                       for idx, txt in sorted(bookmarks.items()))
+    with open(bookmarks_path, "w", encoding="utf-8-sig") as f:
+        f.write('{"bookmarks":[\n' + entries + "]}")
+    return bookmarks_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find chat activity spikes in a live")
+    parser.add_argument("chat", help="NDJSON from get_live_messages.py")
+    parser.add_argument("--start-ms", type=int, help="stream start (epoch ms), default: first message")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--window", type=int, default=10, help="seconds per spike")
+    parser.add_argument("--keywords", default="", help="comma separated, counted per second")
+    parser.add_argument("--between", nargs=2, type=float, metavar=("T1", "T2"), help="print chat between seconds")
+    parser.add_argument("--bookmarks", metavar="SUBTITLE", help="write <SUBTITLE>.SE.bookmarks for the spikes")
+    args = parser.parse_args()
+
+    keywords = [keyword for keyword in args.keywords.split(",") if keyword]
+    index = ChatIndex(read_messages(args.chat), args.start_ms, keywords)
+    print(f"\n-----> {len(index.texts)} messages over {len(index)} s")
+
+    spikes = index.top_spikes(args.top, args.window)
+    for second, count in spikes:
+        line = f"    {format_timestamp(second * 1000)}  {count:>5} messages"
+        for keyword, counts in index.keyword_counts.items():
+            line += f"  {keyword}: {sum(counts[second:second + args.window])}"
+        print(line)
+
+    if args.between:
+        for time_ms, text in index.messages_between(*args.between):
+            print(f"    {format_timestamp(time_ms)}  {text}")
+
+    if args.bookmarks:
+        print(f"\n-----> {write_bookmarks(spikes, args.bookmarks)} created")
+
+
+if __name__ == "__main__":
+    main()
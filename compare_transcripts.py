@@ -0,0 +1,129 @@
+'''file pipeline:
+compare_transcripts.py (several transcriptions of the same stream, e.g. _Large1 .. _Large4)
+    subtitles.py (read .srt / .vtt)
+    align all timelines on --bin-ms bins
+    per file: cues, coverage, cue-count inflation, repeated-cue rate, agreement with the others
+    optional <file>.run.json -> compute seconds per audio hour
+
+usage:
+    python compare_transcripts.py archive-subtitle/output_mp3_2024_October_11_Large*.srt [--json report.json]
+
+<file>.run.json (written next to the .srt by transcribe_parallel.py):
+    {"model": "large-v3", "wall_seconds": 1830, "audio_seconds": 3560}
+'''
+
+
+# Imports
+import argparse
+import json
+import os
+from itertools import combinations
+
+from subtitles import read_subtitles, apply_passes, merge_same_text
+from repeat_detector import find_repeat_runs, normalize_text, trigrams, trigram_similarity
+
+
+def bin_grams(table, bin_ms, bins):
+    # Character trigrams said during each bin (language independent, works for Korean too)
+    binned = [set() for _ in range(bins)]
+    grams = {}
+    for start_ms, end_ms, text_id in table.rows():
+        text_grams = grams.get(text_id)
+        if text_grams is None:
+            text_grams = grams[text_id] = trigrams(normalize_text(table.texts[text_id]))
+        for index in range(start_ms // bin_ms, min(bins, (max(end_ms, start_ms + 1) - 1) // bin_ms + 1)):
+            binned[index] |= text_grams
+    return binned
+
+
+def covered_ms(table):
+    # Length of the union of all cue intervals
+    total = 0
+    covered_until = 0
+    for start_ms, end_ms in sorted(zip(table.starts, table.ends)):
+        start_ms = max(start_ms, covered_until)
+        if end_ms > start_ms:
+            total += end_ms - start_ms
+            covered_until = end_ms
+    return total
+
+
+def agreement(bins_a, bins_b):
+    # Mean text similarity over the bins where at least one of the two has speech
+    scores = [trigram_similarity(a, b) if a and b else 0.0 for a, b in zip(bins_a, bins_b) if a or b]
+    return sum(scores) / len(scores) if scores else 0.0
+
+
+def read_run_metadata(path):
+    metadata_path = path + ".run.json"
+    if not os.path.exists(metadata_path):
+        metadata_path = os.path.splitext(path)[0] + ".run.json"
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(paths, bin_ms=5000):
+    tables = {path: read_subtitles(path) for path in paths}
+    span_ms = max((max(table.ends) for table in tables.values() if len(table)), default=0)
+    bins = span_ms // bin_ms + 1
+    binned = {path: bin_grams(table, bin_ms, bins) for path, table in tables.items()}
+    fewest_cues = min((len(table) for table in tables.values() if len(table)), default=1)
+
+    pairs = {}
+    for a, b in combinations(paths, 2):
+        pairs[(a, b)] = pairs[(b, a)] = agreement(binned[a], binned[b])
+
+    results = []
+    for path, table in tables.items():
+        runs, repeated = find_repeat_runs(table)
+        merged = apply_passes(table, [merge_same_text()])
+        others = [pairs[(path, other)] for other in paths if other != path]
+        result = {
+            "file": path,
+            "cues": len(table),
+            "coverage": covered_ms(table) / span_ms if span_ms else 0.0,
+            "inflation": len(table) / max(len(merged), 1),
+            "cues_vs_fewest": len(table) / fewest_cues,
+            "repeated_rate": len(repeated) / max(len(table), 1),
+            "agreement": sum(others) / len(others) if others else None,
+        }
+
+        metadata = read_run_metadata(path)
+        if metadata and metadata.get("wall_seconds"):
+            audio_seconds = metadata.get("audio_seconds") or span_ms / 1000
+            result["model"] = metadata.get("model")
+            result["compute_seconds_per_audio_hour"] = metadata["wall_seconds"] / (audio_seconds / 3600)
+        results.append(result)
+
+    return results, {f"{a} | {b}": score for (a, b), score in pairs.items() if a < b}
+
+
+def print_table(results):
+    print(f"\n{'file':<48} {'cues':>6} {'cover':>6} {'infl':>5} {'xmin':>5} {'rep':>6} {'agree':>6} {'s/audio h':>10}")
+    for result in results:
+        agree = "-" if result["agreement"] is None else f"{result['agreement']:.2f}"
+        cost = result.get("compute_seconds_per_audio_hour")
+        print(f"{os.path.basename(result['file'])[:48]:<48} {result['cues']:>6} {result['coverage']:>6.1%} "
+              f"{result['inflation']:>5.2f} {result['cues_vs_fewest']:>5.2f} {result['repeated_rate']:>6.1%} "
+              f"{agree:>6} {'-' if cost is None else f'{cost:.0f}':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare transcriptions of the same stream")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--bin-ms", type=int, default=5000, help="timeline resolution for agreement")
+    parser.add_argument("--json", help="write the results and pairwise agreement as JSON")
+    args = parser.parse_args()
+
+    results, pairs = compare(args.files, args.bin_ms)
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"files": results, "pairs": pairs}, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
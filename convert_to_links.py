@@ -0,0 +1,85 @@
+# Imports
+from array import array
+
+
+# Parsed playlist, kept compact so later stages can reuse it without reading the file again:
+#   uris:             segment URIs (rewritten to full links by convert_to_links)
+#   durations:        EXTINF durations in seconds, array of doubles
+#   media_sequence:   EXT-X-MEDIA-SEQUENCE of the first segment
+#   target_duration:  EXT-X-TARGETDURATION in seconds
+#   ended:            True if the playlist has EXT-X-ENDLIST
+#   discontinuities:  indices of segments preceded by EXT-X-DISCONTINUITY (e.g. the live crashed)
+
+class Playlist:
+    __slots__ = ("uris", "durations", "media_sequence", "target_duration", "ended", "discontinuities")
+
+    def __init__(self):
+        self.uris = []
+        self.durations = array("d")
+        self.media_sequence = 0
+        self.target_duration = 0
+        self.ended = False
+        self.discontinuities = array("l")
+
+    def __len__(self):
+        return len(self.uris)
+
+    @property
+    def total_duration(self):
+        return sum(self.durations)
+
+
+def _parse_tag(playlist, line, pending):
+    # Returns the EXTINF duration waiting for the next URI line
+    if line.startswith("#EXTINF:"):
+        return float(line[8:].split(",", 1)[0])
+    if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+        playlist.media_sequence = int(line[22:])
+    elif line.startswith("#EXT-X-TARGETDURATION:"):
+        playlist.target_duration = int(line[22:])
+    elif line.startswith("#EXT-X-ENDLIST"):
+        playlist.ended = True
+    elif line == "#EXT-X-DISCONTINUITY":
+        playlist.discontinuities.append(len(playlist.uris))
+    return pending
+
+
+def parse_playlist(lines):
+    playlist = Playlist()
+    duration = 0.0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if line[0] == "#":
+            duration = _parse_tag(playlist, line, duration)
+        else:
+            playlist.uris.append(line)
+            playlist.durations.append(duration)
+            duration = 0.0
+    return playlist
+
+
+def read_playlist(m3u8_path):
+    with open(m3u8_path, encoding="utf-8") as f:
+        return parse_playlist(f)
+
+
+# Prepend the base URL and append the auth token to every .ts line,
+# copy every other line (#EXTM3U, #EXTINF, etc.) as-is
+
+def convert_to_links(base_url, input_m3u8, auth_token, output_m3u8):
+    playlist = Playlist()
+    duration = 0.0
+    with open(input_m3u8, encoding="utf-8") as src, open(output_m3u8, "w", encoding="utf-8") as dst:
+        for line in src:
+            line = line.rstrip("\r\n")
+            if line.endswith(".ts"):
+                line = base_url + line + auth_token
+                playlist.uris.append(line)
+                playlist.durations.append(duration)
+                duration = 0.0
+            elif line.startswith("#"):
+                duration = _parse_tag(playlist, line, duration)
+            dst.write(line + "\n")
+    return playlist
@@ -0,0 +1,262 @@
+'''file pipeline:
+download_segments.py
+    playlist from convert_to_links.py
+    segment_cache.py (skip segments already verified on disk)
+    preflight.TokenSigner (optional: current auth token, refreshed mid-download)
+    fetch segments in parallel (keep-alive connections)
+    pipe segments in order into one ffmpeg
+        copy .mp4 and/or convert .mp3 from the same input pass
+        optional speech audio (16 kHz mono opus / flac / wav) for transcription, same pass
+'''
+
+
+# Imports
+import http.client
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+from telemetry import progress_command, read_progress
+
+
+DEFAULT_WORKERS = 8
+
+
+class HTTPError(Exception):
+    def __init__(self, url, status):
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+
+
+# Keep-alive connections, one per thread and host
+
+class ConnectionPool:
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def get(self, scheme, netloc):
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conn_class(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def drop(self, scheme, netloc):
+        conn = self._local.conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
+
+def fetch_segment(pool, url, retries=3):
+    parts = urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+
+    for attempt in range(retries + 1):
+        conn = pool.get(parts.scheme, parts.netloc)
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            # Server closed the keep-alive connection or the network dropped
+            pool.drop(parts.scheme, parts.netloc)
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+            continue
+
+        if response.status == 200:
+            return data
+        if response.status < 500 or attempt == retries:
+            raise HTTPError(url, response.status)
+        time.sleep(0.5 * 2 ** attempt)
+
+
+# 403/410: the __gda__ token expired, ask the signer for a new one and retry the segment
+
+def fetch_signed(pool, url, signer):
+    if signer.expiring():
+        signer.refresh(signer.auth_token, required=False)
+    token = signer.auth_token
+    try:
+        return fetch_segment(pool, signer.sign(url))
+    except HTTPError as error:
+        if error.status not in (403, 410):
+            raise
+    signer.refresh(token)
+    return fetch_segment(pool, signer.sign(url))
+
+
+def load_segment(pool, url, cache=None, signer=None):
+    # Returns (data, fetched) so cached segments can be counted separately
+    if cache is not None:
+        name = segment_name(url)
+        data = cache.get(name)
+        if data is not None:
+            return data, False
+    data = fetch_segment(pool, url) if signer is None else fetch_signed(pool, url, signer)
+    if cache is not None:
+        cache.put(name, data)
+    return data, True
+
+
+# Fetch segments concurrently, write them out in playlist order
+
+def download_segments(urls, output, workers=DEFAULT_WORKERS, on_segment=None, cache=None, pool=None, signer=None):
+    stats = {"segments": 0, "bytes": 0, "fetched": 0, "cached": 0, "seconds": 0.0}
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool()
+    start = time.perf_counter()
+
+    def write(index, result):
+        data, fetched = result
+        output.write(data)
+        stats["segments"] += 1
+        stats["bytes"] += len(data)
+        stats["fetched" if fetched else "cached"] += 1
+        if on_segment is not None:
+            on_segment(index, data)
+
+    # Only keep a window of segments in memory; the head of the window is
+    # always the next one to write, so order is kept without buffering the VOD
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for index, url in enumerate(urls):
+                pending.append((index, executor.submit(load_segment, pool, url, cache, signer)))
+                if len(pending) >= workers * 2:
+                    index_done, future = pending.popleft()
+                    write(index_done, future.result())
+            while pending:
+                index_done, future = pending.popleft()
+                write(index_done, future.result())
+    finally:
+        if own_pool:
+            pool.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def format_throughput(stats):
+    seconds = max(stats["seconds"], 1e-9)
+    return (f"{stats['segments']} segments ({stats['cached']} from cache), "
+            f"{stats['bytes'] / 1e6:.1f} MB in {stats['seconds']:.1f} s "
+            f"({stats['bytes'] / 1e6 / seconds:.2f} MB/s, {stats['segments'] / seconds:.1f} segments/s)")
+
+
+# Speech profiles: Whisper resamples everything to 16 kHz mono, so encode that directly instead of
+# a ~245 kbps stereo .mp3 (kept as the archive/publishing output). profile -> (extension, ffmpeg args)
+
+SPEECH_PROFILES = {
+    "opus": (".opus", ["-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "24k", "-application", "voip"]),
+    "flac": (".flac", ["-ac", "1", "-ar", "16000", "-sample_fmt", "s16", "-c:a", "flac"]),
+    "pcm": (".wav", ["-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le"]),
+}
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+# Silences longer than 2 s are cut down to 0.5 s. This shortens the timeline, so a transcript of
+# a trimmed file does not line up with the video: only for search / translation drafts
+TRIM_SILENCE_FILTER = "silenceremove=stop_periods=-1:stop_duration=2:stop_threshold=-45dB:stop_silence=0.5"
+
+
+def speech_args(profile="opus", loudnorm=False, trim_silence=False):
+    filters = [name for name, wanted in ((TRIM_SILENCE_FILTER, trim_silence), (LOUDNORM_FILTER, loudnorm)) if wanted]
+    return (["-af", ",".join(filters)] if filters else []) + SPEECH_PROFILES[profile][1]
+
+
+def speech_name(output_mp3, profile="opus"):
+    # output_mp3_2024_October_11.mp3 -> output_mp3_2024_October_11_speech.opus
+    return output_mp3.rsplit(".", 1)[0] + "_speech" + SPEECH_PROFILES[profile][0]
+
+
+# ffmpeg reads the segments once from stdin and writes every requested output:
+# .mp4 is a stream copy, .mp3 and the speech audio only map the audio (-vn), so "audio only" never muxes video
+
+def build_ffmpeg_command(output_mp4=None, output_mp3=None, output_speech=None, speech_profile="opus",
+                         loudnorm=False, trim_silence=False):
+    if output_mp4 is None and output_mp3 is None and output_speech is None:
+        raise ValueError("at least one of output_mp4, output_mp3 and output_speech is required")
+
+    command = ["ffmpeg", "-y", "-f", "mpegts", "-i", "pipe:0"]
+    if output_mp4 is not None:
+        command += ["-map", "0:v", "-map", "0:a?", "-c", "copy", output_mp4]
+    if output_mp3 is not None:
+        command += ["-map", "0:a", "-vn", "-q:a", "0", output_mp3]
+    if output_speech is not None:
+        command += ["-map", "0:a", "-vn"] + speech_args(speech_profile, loudnorm, trim_silence) + [output_speech]
+    return command
+
+
+# progress: optional callback for ffmpeg's -progress blocks (e.g. telemetry.print_progress)
+
+def _start_ffmpeg(command, progress=None, **popen_args):
+    if progress is None:
+        return subprocess.Popen(command, **popen_args), None
+    ffmpeg = subprocess.Popen(progress_command(command), stdout=subprocess.PIPE, **popen_args)
+    reader = threading.Thread(target=read_progress, args=(ffmpeg.stdout, progress), daemon=True)
+    reader.start()
+    return ffmpeg, reader
+
+
+def download_media(playlist, output_mp4=None, output_mp3=None, workers=DEFAULT_WORKERS, cache_dir=None,
+                   on_segment=None, progress=None, signer=None, output_speech=None, speech_profile="opus",
+                   loudnorm=False, trim_silence=False):
+    urls = playlist.uris
+    cache = None
+    if cache_dir is not None and urls:
+        cache = SegmentCache(cache_dir, vod_id_from_name(segment_name(urls[0])))
+    command = build_ffmpeg_command(output_mp4, output_mp3, output_speech, speech_profile, loudnorm, trim_silence)
+    ffmpeg, reader = _start_ffmpeg(command, progress, stdin=subprocess.PIPE)
+    try:
+        stats = download_segments(urls, ffmpeg.stdin, workers, on_segment, cache, signer=signer)
+    finally:
+        ffmpeg.stdin.close()
+        ffmpeg.wait()
+        if reader is not None:
+            reader.join()
+    stats["returncode"] = ffmpeg.returncode
+
+    print(f"\n-----> {format_throughput(stats)}")
+    return stats
+
+
+# Create .mp3 from an existing .mp4 (when the audio could not be encoded during the download)
+
+def convert_mp3(output_mp4, output_mp3, progress=None):
+    ffmpeg, reader = _start_ffmpeg(["ffmpeg", "-y", "-i", output_mp4, "-q:a", "0", "-map", "a", output_mp3], progress)
+    ffmpeg.wait()
+    if reader is not None:
+        reader.join()
+    return ffmpeg.returncode
+
+
+# Speech audio from an existing .mp4 / .mp3
+
+def convert_speech(input_path, output_speech, profile="opus", loudnorm=False, trim_silence=False, progress=None):
+    command = ["ffmpeg", "-y", "-i", input_path, "-map", "a", "-vn"]
+    ffmpeg, reader = _start_ffmpeg(command + speech_args(profile, loudnorm, trim_silence) + [output_speech], progress)
+    ffmpeg.wait()
+    if reader is not None:
+        reader.join()
+    return ffmpeg.returncode
@@ -1,31 +1,156 @@
 import requests
 import json
+import os
+import time
 from urllib.parse import urlparse, parse_qs
+from telemetry import RunLog, file_size
 
-# Function to fetch live chat messages
-def fetch_live_chat(api_url, params, output_file):
-	response = requests.get(api_url, params=params)
-	if response.status_code == 200:
-		chat_data = response.json()
-		with open(output_file, 'w', encoding='utf-8') as f:
-			json.dump(chat_data, f, ensure_ascii=False, indent=4)
-		print(f"Chat data saved to {output_file}")
-	else:
-		print(f"Failed to fetch chat data. Status code: {response.status_code}")
-
-# Input the URL
-input_url = input("Enter the Weverse chat URL: ")
-
-# Parse the input URL to extract the base URL and query parameters
-parsed_url = urlparse(input_url)
-api_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-params = parse_qs(parsed_url.query)
-
-# Flatten the query parameters
-params = {k: v[0] for k, v in params.items()}
-
-# Define the output file name
-output_file = "live_chat.json"
-
-# Fetch live chat messages
-fetch_live_chat(api_url, params, output_file)
\ No newline at end of file
+# Fields of the chat API response
+MESSAGES_KEY = "data"
+PAGING_KEY = "paging"
+NEXT_PARAMS_KEY = "nextParams"
+MESSAGE_ID_KEY = "messageId"
+
+# Adaptive request pacing: back off on 429 / 5xx, speed up again slowly while requests succeed
+class Throttle:
+	def __init__(self, min_delay=0.2, max_delay=60.0):
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		self.delay = min_delay
+		self.last_request = 0.0
+
+	def wait(self):
+		remaining = self.last_request + self.delay - time.monotonic()
+		if remaining > 0:
+			time.sleep(remaining)
+		self.last_request = time.monotonic()
+
+	def success(self):
+		self.delay = max(self.min_delay, self.delay * 0.9)
+
+	def backoff(self, retry_after=None):
+		self.delay = min(self.max_delay, max(self.delay * 2, retry_after or 0))
+
+def _retry_after(response):
+	try:
+		return float(response.headers.get("Retry-After", ""))
+	except ValueError:
+		return None
+
+# Function to fetch one page of chat messages, retrying on 429 and 5xx
+def fetch_page(session, api_url, params, throttle, retries=6):
+	for attempt in range(retries + 1):
+		throttle.wait()
+		try:
+			response = session.get(api_url, params=params, timeout=30)
+		except requests.RequestException:
+			if attempt == retries:
+				raise
+			throttle.backoff()
+			continue
+
+		if response.status_code == 200:
+			throttle.success()
+			return response.json()
+		if (response.status_code != 429 and response.status_code < 500) or attempt == retries:
+			raise RuntimeError(f"Failed to fetch chat data. Status code: {response.status_code}")
+		throttle.backoff(_retry_after(response))
+
+def _message_id(message):
+	message_id = message.get(MESSAGE_ID_KEY)
+	if message_id is None:
+		message_id = json.dumps(message, sort_keys=True)
+	return str(message_id)
+
+def _read_seen_ids(output_file):
+	seen = set()
+	if os.path.exists(output_file):
+		with open(output_file, encoding="utf-8") as f:
+			for line in f:
+				try:
+					seen.add(_message_id(json.loads(line)))
+				except ValueError:
+					continue	# torn last line from an interrupted run
+	return seen
+
+# The paging cursor of the last stored page is kept next to the NDJSON, so an interrupted
+# collection goes on from there instead of fetching every page again
+def _cursor_file(output_file):
+	return output_file + ".cursor"
+
+def _read_cursor(output_file, api_url):
+	try:
+		with open(_cursor_file(output_file), encoding="utf-8") as f:
+			cursor = json.load(f)
+	except (OSError, ValueError):
+		return None
+	return cursor.get("next_params") if cursor.get("api_url") == api_url else None
+
+def _write_cursor(output_file, api_url, next_params):
+	tmp_path = _cursor_file(output_file) + ".part"
+	with open(tmp_path, "w", encoding="utf-8") as f:
+		json.dump({"api_url": api_url, "next_params": next_params}, f)
+	os.replace(tmp_path, _cursor_file(output_file))
+
+# Function to fetch live chat messages: follows the paging cursor and appends
+# every new message to output_file as one compact JSON line (NDJSON)
+def fetch_live_chat(api_url, params, output_file, session=None, throttle=None, max_pages=None):
+	session = session or requests.Session()
+	throttle = throttle or Throttle()
+	seen = _read_seen_ids(output_file)
+	stats = {"pages": 0, "messages": 0, "duplicates": 0}
+
+	cursor = _read_cursor(output_file, api_url)
+	if cursor:
+		params = {**params, **cursor}
+		print(f"Resuming {output_file} from {cursor}")
+
+	with open(output_file, "a", encoding="utf-8") as f:
+		while max_pages is None or stats["pages"] < max_pages:
+			page = fetch_page(session, api_url, params, throttle)
+			stats["pages"] += 1
+
+			for message in page.get(MESSAGES_KEY) or []:
+				message_id = _message_id(message)
+				if message_id in seen:
+					stats["duplicates"] += 1
+					continue
+				seen.add(message_id)
+				f.write(json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n")
+				stats["messages"] += 1
+			f.flush()
+
+			next_params = (page.get(PAGING_KEY) or {}).get(NEXT_PARAMS_KEY)
+			if not next_params:
+				break
+			if next_params == cursor:
+				# The API handed back the cursor it was just given: following it would never end
+				print(f"Paging cursor {next_params} repeated, stopping")
+				break
+			cursor = next_params
+			params = {**params, **next_params}
+			_write_cursor(output_file, api_url, next_params)
+
+	print(f"Chat data saved to {output_file} ({stats['messages']} new messages, {stats['pages']} pages)")
+	return stats
+
+if __name__ == "__main__":
+	# Input the URL
+	input_url = input("Enter the Weverse chat URL: ")
+
+	# Parse the input URL to extract the base URL and query parameters
+	parsed_url = urlparse(input_url)
+	api_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
+	params = parse_qs(parsed_url.query)
+
+	# Flatten the query parameters
+	params = {k: v[0] for k, v in params.items()}
+
+	# Define the output file name
+	output_file = "live_chat.ndjson"
+
+	# Fetch live chat messages
+	with RunLog("run_log.jsonl").stage("chat_fetch") as stage:
+		stats = fetch_live_chat(api_url, params, output_file)
+		stage.segments = stats["pages"]
+		stage.bytes_out = file_size(output_file)
@@ -0,0 +1,371 @@
+'''file pipeline:
+library.py (after Main.py / batch.py; Main.py checks it before downloading)
+    .mp4 / .mp3 / .srt / .vtt / .m3u8 / live_chat.ndjson
+    sha256 -> library/objects/<ab>/<sha256>.<ext>, a read-only copy (reflink where the filesystem can)
+        working files and restored files are separate copies, so rewriting them never changes a stored object
+    library.sqlite: member, date, VOD id, duration, subtitle variant per file
+        .mp4 that failed verify_segments.py are kept as unverified and never restored
+    lookups by VOD id / member / date / hash go through indexes, no directory scans
+
+usage:
+    python library.py ingest output_m3u8_<vod>.m3u8 output_mp4_2024_October_11.mp4 ... [--vod-id ...] [--member ...]
+    python library.py find [--member kazuha] [--date 2024-10-11] [--vod-id ...] [--kind subtitle]
+    python library.py restore <vod_id> video output.mp4
+    python library.py verify    (rehash every object; lookups only check that the object is there with its size)
+'''
+
+
+# Imports
+import argparse
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import stat
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from convert_to_links import read_playlist
+from segment_cache import segment_name, vod_id_from_name
+from subtitles import read_subtitles
+from verify_segments import mp4_duration
+
+
+KINDS = {".mp4": "video", ".ts": "video", ".mp3": "audio", ".opus": "audio", ".flac": "audio", ".wav": "audio",
+         ".srt": "subtitle", ".vtt": "subtitle", ".m3u8": "playlist", ".ndjson": "chat", ".png": "thumbnail"}
+
+# Nicknames used in file names -> member
+MEMBERS = {"chaewon": "chaewon", "sakura": "sakura", "kkura": "sakura", "yunjin": "yunjin",
+           "kazuha": "kazuha", "eunchae": "eunchae"}
+
+UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+# output_mp4_2024_October_11(1)_kazuha_Large4_kr
+OUTPUT_RE = re.compile(r"^output_(?:mp4|mp3|m3u8)_(\d{4})_([A-Za-z]+)_(\d{1,2})(?:\((\d+)\))?(.*)$")
+# 25oct2024-yunjin-live_ko_KR_user, 2024-10-Oct-27-lesserafim-makeup-challenge
+SHORT_DATE_RE = re.compile(r"^(\d{1,2})([a-z]{3})(\d{4})-(.*)$", re.IGNORECASE)
+DASHED_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-[A-Za-z]{3}-(\d{1,2})-(.*)$")
+# Segment URLs in a rewritten playlist: .../weverse_2024_10_11_0/hls/...
+URL_DATE_RE = re.compile(r"weverse_(\d{4})_(\d{2})_(\d{2})_")
+
+
+def parse_name(filename):
+    # Returns {"date", "same_day_index", "member", "part", "variant"} from the archive's naming habits
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    info = {"date": None, "same_day_index": 0, "member": None, "part": None, "variant": None}
+    rest = UUID_RE.sub("", stem)
+    if rest.startswith("output_m3u8_"):
+        rest = rest[len("output_m3u8_"):]
+
+    match = OUTPUT_RE.match(stem)
+    if match:
+        year, month, day, index, rest = match.groups()
+        info["date"] = datetime.strptime(f"{year} {month} {day}", "%Y %B %d").strftime("%Y-%m-%d")
+        info["same_day_index"] = int(index or 0)
+    elif SHORT_DATE_RE.match(stem):
+        day, month, year, rest = SHORT_DATE_RE.match(stem).groups()
+        info["date"] = datetime.strptime(f"{year} {month} {day}", "%Y %b %d").strftime("%Y-%m-%d")
+    elif DASHED_DATE_RE.match(stem):
+        year, month, day, rest = DASHED_DATE_RE.match(stem).groups()
+        info["date"] = f"{year}-{month}-{int(day):02d}"
+
+    variant = []
+    for word in re.split(r"[_\s-]+", rest):
+        if not word:
+            continue
+        if word.lower() in MEMBERS and info["member"] is None:
+            info["member"] = MEMBERS[word.lower()]
+        elif word.isdigit() and info["part"] is None:
+            info["part"] = int(word)
+        else:
+            variant.append(word)
+    info["variant"] = "_".join(variant) or None
+    return info
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# FICLONE ioctl: copy-on-write clone on btrfs / xfs, the copy shares blocks until one side is written
+FICLONE = 0x40049409
+
+
+def clone_file(source, destination):
+    tmp_path = destination + ".part"
+    with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except (AttributeError, OSError):     # no fcntl (Windows) or no reflink support: plain copy
+            shutil.copyfileobj(src, dst, 1 << 20)
+    shutil.copystat(source, tmp_path)
+    os.chmod(tmp_path, stat.S_IMODE(os.stat(source).st_mode) | stat.S_IWUSR)
+    os.replace(tmp_path, destination)
+    return destination
+
+
+def _duration(path, kind):
+    # Cheap durations only: playlist EXTINF total, .mp4 mvhd, last subtitle cue
+    try:
+        if kind == "playlist":
+            return read_playlist(path).total_duration
+        if kind == "video" and path.endswith(".mp4"):
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return mp4_duration(data)
+        if kind == "subtitle":
+            table = read_subtitles(path)
+            return max(table.ends, default=0) / 1000
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def playlist_vod_info(path):
+    # VOD id and date from the segment URLs of a (rewritten) playlist
+    playlist = read_playlist(path)
+    if not playlist.uris:
+        return None, None
+    match = URL_DATE_RE.search(playlist.uris[0])
+    date = "-".join(match.groups()) if match else None
+    return vod_id_from_name(segment_name(playlist.uris[0])), date
+
+
+class Library:
+    def __init__(self, root="library"):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, "library.sqlite"))
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, extension TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT PRIMARY KEY, name TEXT NOT NULL, sha256 TEXT NOT NULL, kind TEXT NOT NULL,
+                vod_id TEXT, date TEXT, same_day_index INTEGER, member TEXT, part INTEGER, variant TEXT,
+                duration REAL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, ingested_at INTEGER NOT NULL,
+                verified INTEGER NOT NULL DEFAULT 1);
+            CREATE INDEX IF NOT EXISTS entries_vod ON entries (vod_id, kind);
+            CREATE INDEX IF NOT EXISTS entries_member_date ON entries (member, date);
+            CREATE INDEX IF NOT EXISTS entries_date ON entries (date, same_day_index);
+            CREATE INDEX IF NOT EXISTS entries_sha256 ON entries (sha256);
+        """)
+        if "verified" not in {row["name"] for row in self.db.execute("PRAGMA table_info(entries)")}:
+            self.db.execute("ALTER TABLE entries ADD COLUMN verified INTEGER NOT NULL DEFAULT 1")
+
+    def object_path(self, sha256, extension):
+        return os.path.join(self.objects_dir, sha256[:2], sha256 + extension)
+
+    def _store(self, path, sha256, extension):
+        # The object is a read-only copy, never a link to the working file: subtitles.py, convert_to_links
+        # and ffmpeg rewrite their outputs in place, which would change the stored bytes under their hash
+        obj = self.object_path(sha256, extension)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            clone_file(path, obj)
+            os.chmod(obj, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            self.db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+                            (sha256, os.path.getsize(obj), extension))
+        elif os.path.samefile(path, obj):
+            clone_file(obj, path)       # hardlink left by an older library: break it
+        return obj
+
+    def _drop_object(self, sha256, extension):
+        obj = self.object_path(sha256, extension)
+        if os.path.exists(obj):
+            os.chmod(obj, stat.S_IRUSR | stat.S_IWUSR)
+            os.remove(obj)
+        self.db.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+        self.db.commit()
+
+    def object_intact(self, sha256, extension):
+        # Cheap check for lookups: objects are read-only copies, so a present object of the stored size is trusted
+        row = self.db.execute("SELECT size FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+        try:
+            intact = row is not None and os.path.getsize(self.object_path(sha256, extension)) == row["size"]
+        except OSError:
+            intact = False
+        if not intact:
+            self._drop_object(sha256, extension)
+        return intact
+
+    def verify_objects(self):
+        # Full check (python library.py verify): rehash every object, drop the ones that no longer match their name
+        bad = []
+        for row in self.db.execute("SELECT sha256, extension FROM objects").fetchall():
+            obj = self.object_path(row["sha256"], row["extension"])
+            if not os.path.exists(obj) or file_sha256(obj) != row["sha256"]:
+                self._drop_object(row["sha256"], row["extension"])
+                bad.append(obj)
+        return bad
+
+    def ingest(self, path, vod_id=None, member=None, kind=None, verified=True):
+        # verified=False: stored and findable, but lookup() will not restore it instead of a download
+        path = os.path.abspath(path)
+        file_stat = os.stat(path)
+        known = self.db.execute("SELECT * FROM entries WHERE path = ?", (path,)).fetchone()
+        if (known is not None and known["size"] == file_stat.st_size and known["mtime_ns"] == file_stat.st_mtime_ns
+                and known["verified"] == int(verified) and self.has_object(known["sha256"])):
+            return known    # unchanged since the last ingest: no rehash
+
+        extension = os.path.splitext(path)[1].lower()
+        kind = kind or KINDS.get(extension, "other")
+        info = parse_name(path)
+        if kind == "playlist":
+            playlist_vod_id, playlist_date = playlist_vod_info(path)
+            vod_id = vod_id or playlist_vod_id
+            info["date"] = info["date"] or playlist_date
+        elif vod_id is None:
+            match = UUID_RE.search(os.path.basename(path))
+            vod_id = match.group(0) if match else None
+
+        sha256 = file_sha256(path)
+        self._store(path, sha256, extension)
+        file_stat = os.stat(path)
+        self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            path, os.path.basename(path), sha256, kind, vod_id, info["date"], info["same_day_index"],
+            member or info["member"], info["part"], info["variant"], _duration(path, kind),
+            file_stat.st_size, file_stat.st_mtime_ns, int(time.time()), int(verified),
+        ))
+        self.db.commit()
+        return self.db.execute("SELECT * FROM entries WHERE path = ?", (path,)).fetchone()
+
+    def ingest_files(self, paths, vod_id=None, member=None, unverified=()):
+        # Files of one run belong together: a playlist among them gives its VOD id to the others
+        paths = [path for path in paths if path and os.path.exists(path)]
+        unverified = {os.path.abspath(path) for path in unverified if path}
+        if vod_id is None:
+            for path in paths:
+                if path.endswith(".m3u8"):
+                    vod_id = playlist_vod_info(path)[0]
+                    break
+        return [self.ingest(path, vod_id, member, verified=os.path.abspath(path) not in unverified) for path in paths]
+
+    def has_object(self, sha256):
+        return self.db.execute("SELECT 1 FROM objects WHERE sha256 = ?", (sha256,)).fetchone() is not None
+
+    def find_vod(self, vod_id):
+        # {kind: newest entry} for a VOD id, e.g. to skip downloading it again
+        found = {}
+        for row in self.db.execute("SELECT * FROM entries WHERE vod_id = ? ORDER BY ingested_at", (vod_id,)):
+            found[row["kind"]] = row
+        return found
+
+    def lookup(self, vod_id, extension):
+        # Newest verified file of a VOD with this extension (".mp4", ".mp3", ...) whose object is there, or None;
+        # indexed query plus one stat per candidate, the content is not read
+        rows = self.db.execute("SELECT * FROM entries WHERE vod_id = ? AND path LIKE ? AND verified = 1 "
+                               "ORDER BY ingested_at DESC", (vod_id, "%" + extension)).fetchall()
+        for row in rows:
+            if self.object_intact(row["sha256"], extension.lower()):
+                return row
+        return None
+
+    def restore_outputs(self, vod_id, extensions, names_for_index):
+        # An archived VOD keeps the same-day index it was archived with, so a rerun never takes a new one:
+        # outputs still in place are left alone, missing ones are copied back.
+        # names_for_index(index) -> {extension: path}; index None means the next free index, used only if the
+        # original names now hold other files. Returns (names, [(path, "in place" | "restored")]) or None
+        entries = [self.lookup(vod_id, extension) for extension in extensions]
+        if not entries or not all(entries):
+            return None
+        names = names_for_index(entries[0]["same_day_index"] or 0)
+        if any(os.path.exists(names[extension]) and os.path.getsize(names[extension]) != entry["size"]
+               for extension, entry in zip(extensions, entries)):
+            names = names_for_index(None)
+        placed = []
+        for extension, entry in zip(extensions, entries):
+            path = names[extension]
+            if os.path.exists(path) and os.path.getsize(path) == entry["size"]:
+                placed.append((path, "in place"))
+            else:
+                placed.append((self.restore(entry, path), "restored"))
+        return names, placed
+
+    def find(self, member=None, date=None, vod_id=None, kind=None):
+        conditions = [(column, value) for column, value in
+                      (("member", member), ("date", date), ("vod_id", vod_id), ("kind", kind)) if value]
+        where = " AND ".join(f"{column} = ?" for column, _ in conditions) or "1"
+        return self.db.execute(f"SELECT * FROM entries WHERE {where} ORDER BY date, same_day_index, kind, name",
+                               [value for _, value in conditions]).fetchall()
+
+    def restore(self, entry, destination):
+        # Copy (or reflink) the stored object to a new name, no download; the copy is safe to rewrite
+        obj = self.object_path(entry["sha256"], os.path.splitext(entry["path"])[1].lower())
+        return clone_file(obj, destination)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def format_entry(row):
+    duration = "" if row["duration"] is None else f"{row['duration'] / 60:6.1f} min"
+    return (f"{row['date'] or '?':10}  {row['member'] or '-':8}  {row['kind']:9}  {duration:>10}  "
+            f"{row['variant'] or '':18}  {row['path']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed library of archived outputs")
+    parser.add_argument("--root", default="library")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="add files of one VOD")
+    ingest_parser.add_argument("paths", nargs="+")
+    ingest_parser.add_argument("--vod-id")
+    ingest_parser.add_argument("--member", help="overrides the member found in the file names")
+
+    find_parser = subparsers.add_parser("find")
+    find_parser.add_argument("--member")
+    find_parser.add_argument("--date", help="YYYY-MM-DD")
+    find_parser.add_argument("--vod-id")
+    find_parser.add_argument("--kind", choices=sorted(set(KINDS.values())))
+
+    subparsers.add_parser("verify", help="rehash every stored object, drop damaged ones")
+
+    restore_parser = subparsers.add_parser("restore", help="copy a stored file to a new name")
+    restore_parser.add_argument("vod_id")
+    restore_parser.add_argument("kind", choices=sorted(set(KINDS.values())))
+    restore_parser.add_argument("destination")
+    args = parser.parse_args()
+
+    library = Library(args.root)
+    try:
+        if args.command == "ingest":
+            start = time.perf_counter()
+            rows = library.ingest_files(args.paths, args.vod_id, args.member)
+            for row in rows:
+                print(format_entry(row))
+            print(f"\n-----> {len(rows)} files ingested in {time.perf_counter() - start:.1f} s")
+        elif args.command == "find":
+            rows = library.find(args.member, args.date, args.vod_id, args.kind)
+            for row in rows:
+                print(format_entry(row))
+            print(f"\n-----> {len(rows)} files")
+        elif args.command == "verify":
+            start = time.perf_counter()
+            bad = library.verify_objects()
+            for path in bad:
+                print(f"damaged or missing, dropped: {path}")
+            print(f"\n-----> {len(bad)} bad objects in {time.perf_counter() - start:.1f} s")
+        else:
+            entry = library.find_vod(args.vod_id).get(args.kind)
+            if entry is None:
+                raise SystemExit(f"\n-----> no {args.kind} for {args.vod_id} in {args.root}")
+            print(f"\n-----> {library.restore(entry, args.destination)} created")
+    finally:
+        library.close()
+
+
+if __name__ == "__main__":
+    main()
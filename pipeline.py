@@ -0,0 +1,367 @@
+'''file pipeline:
+pipeline.py (headless Main.py + the README steps after it)
+    every step is a stage with declared input / output files
+    a stage runs only if an output is missing or the content hash of its inputs / parameters changed
+    stages whose inputs are ready run in parallel (thumbnails next to mp3 -> transcription)
+
+    playlist_rewrite   <vod>.m3u8                  -> output_m3u8_<vod>.m3u8    (convert_to_links.py)
+    download           output_m3u8_<vod>.m3u8      -> output_mp4_<date>.mp4 + output_mp3_<date>.mp3 (+ *_speech.opus)
+                                                      (download_segments.py, one ffmpeg pass; one of them in video / audio mode)
+                                                      preflight.py first: fails if the token expires before the end
+                                                      .mp4 matches the playlist: the VOD's segment_cache/ entries are deleted
+                                                      same playlist, media already there: only the speech audio (ffmpeg)
+    transcribe         .mp3 / speech audio         -> output_mp3_<date>.srt     (transcribe_parallel.py)
+    subtitle_fix       .srt                        -> *_fixed.srt               (subtitles.py)
+    thumbnails         .mp4 (+ live_chat.ndjson)   -> thumbnails_<date>.json + .png (thumbnails.py)
+
+usage:
+    python pipeline.py "<m3u8 URL>" [--dry-run] [--speech opus] [--title "..."] [--force transcribe]
+'''
+
+
+# Imports
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from split_link import VodUrl, output_names, next_output_index
+from convert_to_links import convert_to_links, read_playlist
+from download_segments import DEFAULT_WORKERS, SPEECH_PROFILES, convert_speech, download_media, speech_name
+from preflight import TokenSigner, format_preflight, preflight
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+from verify_segments import verify_mp4
+from audio_chunker import WhisperTranscriber
+from transcribe_parallel import transcribe_parallel
+from subtitles import apply_passes, read_subtitles, write_subtitles
+from thumbnails import compose_thumbnail, rank_keyframes, sample_keyframes
+from chat_index import ChatIndex, read_messages
+from telemetry import RunLog, file_size
+
+
+class StageFailed(Exception):
+    pass
+
+
+class Stage:
+    # run(stage) does the work; fingerprints: {input path: function(path) -> str} replaces the
+    # file hash for inputs whose bytes change without the content mattering (e.g. auth tokens)
+    def __init__(self, name, run, inputs=(), outputs=(), params=None, fingerprints=None):
+        self.name = name
+        self.run = run
+        self.inputs = [path for path in inputs if path]
+        self.outputs = [path for path in outputs if path]
+        self.params = params or {}
+        self.fingerprints = fingerprints or {}
+        self.inputs_changed = True     # set before run(): False if only parameters / outputs changed
+
+
+def playlist_fingerprint(path):
+    # Segment names and durations only: a refreshed token rewrites every line but not the VOD
+    playlist = read_playlist(path)
+    digest = hashlib.sha256()
+    for uri, duration in zip(playlist.uris, playlist.durations):
+        digest.update(f"{urlsplit(uri).path}|{duration}\n".encode())
+    return digest.hexdigest()
+
+
+# Content hashes are cached by (size, mtime) in the state file, so a 3 GB .mp4 is hashed once
+
+class PipelineState:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {"files": {}, "stages": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            known = self.data["files"].get(os.path.abspath(path))
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with self._lock:
+            self.data["files"][os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def _inputs(self, stage):
+        inputs = []
+        for path in stage.inputs:
+            fingerprint = stage.fingerprints.get(path, self.file_hash)
+            inputs.append([os.path.basename(path), fingerprint(path)])
+        return inputs
+
+    def signature(self, stage):
+        key = [stage.name, sorted(stage.params.items()), self._inputs(stage), [os.path.basename(path) for path in stage.outputs]]
+        return hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+
+    def input_signature(self, stage):
+        # Inputs only: tells a stage whether its inputs changed or just its parameters / outputs
+        return hashlib.sha256(json.dumps(self._inputs(stage)).encode()).hexdigest()
+
+    def inputs_changed(self, stage, input_signature):
+        with self._lock:
+            return self.data.get("inputs", {}).get(stage.name) != input_signature
+
+    def is_current(self, stage, signature):
+        with self._lock:
+            recorded = self.data["stages"].get(stage.name)
+        return recorded == signature and all(os.path.exists(path) for path in stage.outputs)
+
+    def record(self, stage, signature, input_signature=None):
+        with self._lock:
+            self.data["stages"][stage.name] = signature
+            if input_signature is not None:
+                self.data.setdefault("inputs", {})[stage.name] = input_signature
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+class Pipeline:
+    def __init__(self, stages, state_path="pipeline_state.json", run_log=None, max_parallel=2):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state = PipelineState(state_path)
+        self.run_log = run_log or RunLog()
+        self.max_parallel = max_parallel
+        producers = {os.path.abspath(path): stage.name for stage in stages for path in stage.outputs}
+        self.deps = {stage.name: {producers[os.path.abspath(path)] for path in stage.inputs
+                                  if os.path.abspath(path) in producers} for stage in stages}
+
+    def order(self):
+        # Topological order (stable in declaration order)
+        ordered, seen = [], set()
+
+        def visit(name, path=()):
+            if name in path:
+                raise ValueError(f"stage cycle: {' -> '.join(path + (name,))}")
+            if name in seen:
+                return
+            for dep in sorted(self.deps[name]):
+                visit(dep, path + (name,))
+            seen.add(name)
+            ordered.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return ordered
+
+    def plan(self, force=()):
+        # Dry run: {stage: reason}; a stage after one that will run is assumed to run too
+        reasons = {}
+        for name in self.order():
+            stage = self.stages[name]
+            upstream = [dep for dep in self.deps[name] if reasons[dep] != "up to date"]
+            missing = [path for path in stage.inputs if not os.path.exists(path)]
+            if name in force:
+                reasons[name] = "forced"
+            elif upstream:
+                reasons[name] = f"after {', '.join(sorted(upstream))}"
+            elif missing:
+                reasons[name] = f"missing input {os.path.basename(missing[0])}"
+            elif not self.state.is_current(stage, self.state.signature(stage)):
+                reasons[name] = "inputs changed" if self.state.data["stages"].get(name) else "never run"
+            else:
+                reasons[name] = "up to date"
+        return reasons
+
+    def _run_stage(self, name, force):
+        stage = self.stages[name]
+        missing = [path for path in stage.inputs if not os.path.exists(path)]
+        if missing:
+            raise StageFailed(f"{name}: missing input {missing[0]}")
+        signature = self.state.signature(stage)
+        if name not in force and self.state.is_current(stage, signature):
+            return "skipped"
+        input_signature = self.state.input_signature(stage)
+        stage.inputs_changed = name in force or self.state.inputs_changed(stage, input_signature)
+        with self.run_log.stage(name) as log:
+            log.bytes_in = file_size(*stage.inputs)
+            result = stage.run(stage)
+            log.returncode = result if isinstance(result, int) else None
+            log.bytes_out = file_size(*stage.outputs)
+        if isinstance(result, int) and result != 0:
+            raise StageFailed(f"{name}: exited with {result}")
+        absent = [path for path in stage.outputs if not os.path.exists(path)]
+        if absent:
+            raise StageFailed(f"{name}: did not create {absent[0]}")
+        self.state.record(stage, signature, input_signature)
+        return "ran"
+
+    def run(self, force=()):
+        # Returns {stage: "ran" | "skipped" | "failed: ..." | "blocked"}
+        results = {}
+        pending = set(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while pending or running:
+                for name in [name for name in self.order() if name in pending]:
+                    if any(results.get(dep, "").startswith(("failed", "blocked")) for dep in self.deps[name]):
+                        results[name] = "blocked"
+                        pending.discard(name)
+                    elif all(dep in results for dep in self.deps[name]):
+                        running[executor.submit(self._run_stage, name, force)] = name
+                        pending.discard(name)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as error:
+                        results[name] = f"failed: {error}"
+                    print(f"\n-----> {name}: {results[name]}")
+        return results
+
+
+# Stages for one VOD, same names and steps as Main.py
+
+def build_vod_stages(file_url, input_m3u8=None, output_dir=".", mode="both", speech=None, workers=DEFAULT_WORKERS,
+                     cache_dir="segment_cache", model="large-v3", transcribe_workers=None, title="", chat=None,
+                     reserve_names=True, ignore_expiry=False):
+    vod_url = VodUrl.parse(file_url)
+    input_m3u8 = input_m3u8 or vod_url.input_m3u8
+    output_m3u8 = os.path.join(output_dir, "output_m3u8_" + vod_url.input_m3u8)
+
+    # Reuse the names of an earlier run of this pipeline, otherwise take the next same-day index
+    names_path = os.path.join(output_dir, f"pipeline_names_{vod_url.vod_id}.json")
+    if os.path.exists(names_path):
+        with open(names_path, encoding="utf-8") as f:
+            output_mp4, output_mp3 = json.load(f)
+    else:
+        output_mp4, output_mp3 = [os.path.join(output_dir, name) for name in
+                                  output_names(vod_url.date, next_output_index(vod_url.date, output_dir))]
+        if reserve_names:
+            with open(names_path, "w", encoding="utf-8") as f:
+                json.dump([output_mp4, output_mp3], f)
+    # One download writes the .mp4 and the .mp3 in the same ffmpeg pass, the .mp4 is never read again for audio
+    want_mp4, want_mp3 = mode in ("both", "video"), mode in ("both", "audio")
+    downloaded = [path for path, wanted in ((output_mp4, want_mp4), (output_mp3, want_mp3)) if wanted]
+    source = output_mp4 if want_mp4 else output_mp3
+    output_speech = speech_name(output_mp3, speech) if speech else None
+    transcribe_input = output_speech or output_mp3
+    output_srt = output_mp3.rsplit(".", 1)[0] + ".srt"
+    fixed_srt = output_mp3.rsplit(".", 1)[0] + "_fixed.srt"
+    thumbnails_json = os.path.join(output_dir, f"thumbnails_{vod_url.date}.json")
+
+    def playlist_rewrite(stage):
+        convert_to_links(vod_url.base_url, input_m3u8, vod_url.auth_token, output_m3u8)
+
+    def download(stage):
+        if speech and not stage.inputs_changed and all(os.path.exists(path) for path in downloaded):
+            # Same playlist and the media are already written: only the speech audio is new (profile turned on
+            # or changed), made from the finished file instead of downloading again
+            return convert_speech(source, output_speech, speech)
+        # Headless: no refreshed URL can be asked for, so an expired token fails the stage (rerun with a fresh URL,
+        # the cached segments are kept) and so does a token that would expire before the download finishes
+        playlist = read_playlist(output_m3u8)
+        signer = TokenSigner(vod_url)
+        check = preflight(playlist, signer, workers, cache_dir)
+        print(f"\n-----> preflight: {format_preflight(check)}")
+        if not check["ok"] and not ignore_expiry:
+            raise StageFailed("download: token expires before the download would finish, "
+                              "rerun with a fresh URL or --ignore-expiry")
+        returncode = download_media(playlist, output_mp4 if want_mp4 else None, output_mp3 if want_mp3 else None,
+                                    workers, cache_dir, signer=signer, output_speech=output_speech,
+                                    speech_profile=speech or "opus")["returncode"]
+        # The cached segments are only kept for verify_segments.py --repair once the .mp4 matches the playlist
+        if returncode == 0 and want_mp4 and playlist.uris and not verify_mp4(output_mp4, playlist)[0]:
+            SegmentCache(cache_dir, vod_id_from_name(segment_name(playlist.uris[0]))).clear()
+        return returncode
+
+    def transcribe(stage):
+        transcribe_parallel(transcribe_input, output_srt, transcribe_workers, factory=WhisperTranscriber,
+                            factory_args=(model,))
+
+    def subtitle_fix(stage):
+        write_subtitles(apply_passes(read_subtitles(output_srt)), fixed_srt)
+
+    def thumbnails(stage):
+        chat_index = ChatIndex(read_messages(chat)) if chat else None
+        candidates = rank_keyframes(sample_keyframes(output_mp4), chat_index)
+        created = []
+        for number, (total, seconds, scores) in enumerate(candidates, 1):
+            output_png = os.path.join(output_dir, f"thumbnail_{vod_url.date}_{number:02d}.png")
+            compose_thumbnail(output_mp4, seconds, output_png, title)
+            created.append({"png": output_png, "seconds": seconds, "score": total, "scores": scores})
+        with open(thumbnails_json, "w", encoding="utf-8") as f:
+            json.dump(created, f, ensure_ascii=False, indent=4)
+
+    stages = [
+        Stage("playlist_rewrite", playlist_rewrite, [input_m3u8], [output_m3u8],
+              {"base_url": vod_url.base_url, "auth_token": vod_url.auth_token},
+              {input_m3u8: playlist_fingerprint}),
+        Stage("download", download, [output_m3u8], downloaded + [output_speech], {"mode": mode, "speech": speech},
+              {output_m3u8: playlist_fingerprint}),
+    ]
+    if mode in ("both", "audio") or speech:
+        stages.append(Stage("transcribe", transcribe, [transcribe_input], [output_srt], {"model": model}))
+        stages.append(Stage("subtitle_fix", subtitle_fix, [output_srt], [fixed_srt]))
+    if mode in ("both", "video"):
+        stages.append(Stage("thumbnails", thumbnails, [output_mp4, chat], [thumbnails_json], {"title": title}))
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the VOD pipeline, only the stages whose inputs changed")
+    parser.add_argument("url", help="m3u8 URL copied from Weverse (replaces the input() prompt of Main.py)")
+    parser.add_argument("--input-m3u8", help="downloaded playlist (default: <vod id>.m3u8)")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--mode", choices=("both", "video", "audio"), default="both")
+    parser.add_argument("--speech", choices=sorted(SPEECH_PROFILES), help="transcribe from 16 kHz mono audio")
+    parser.add_argument("--model", default="large-v3")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="segments fetched at once")
+    parser.add_argument("--transcribe-workers", type=int)
+    parser.add_argument("--cache-dir", default="segment_cache")
+    parser.add_argument("--title", default="", help="thumbnail title")
+    parser.add_argument("--chat", help="live_chat.ndjson for the thumbnail ranking")
+    parser.add_argument("--parallel", type=int, default=2, help="stages running at the same time")
+    parser.add_argument("--force", action="append", default=[], help="run this stage even if it is up to date")
+    parser.add_argument("--dry-run", action="store_true", help="show what would run")
+    parser.add_argument("--ignore-expiry", action="store_true", help="download even if the token looks too short")
+    parser.add_argument("--state", help="default: <output dir>/pipeline_state_<vod id>.json")
+    parser.add_argument("--run-log", default="run_log.jsonl")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stages = build_vod_stages(args.url, args.input_m3u8, args.output_dir, args.mode, args.speech, args.workers,
+                              args.cache_dir, args.model, args.transcribe_workers, args.title, args.chat,
+                              reserve_names=not args.dry_run, ignore_expiry=args.ignore_expiry)
+    vod_id = VodUrl.parse(args.url).vod_id
+    state_path = args.state or os.path.join(args.output_dir, f"pipeline_state_{vod_id}.json")
+    pipeline = Pipeline(stages, state_path, RunLog(args.run_log), args.parallel)
+
+    if args.dry_run:
+        for name, reason in pipeline.plan(args.force).items():
+            # Stages after one that runs only run if its outputs actually change
+            action = "skip " if reason == "up to date" else "maybe" if reason.startswith("after") else "run  "
+            print(f"{action}  {name:<17} {reason}")
+        return
+
+    start = time.perf_counter()
+    results = pipeline.run(args.force)
+    print("\n" + "="*50)
+    for name in pipeline.order():
+        print(f"{name:<17} {results.get(name, 'not run')}")
+    print(f"\n-----> {time.perf_counter() - start:.1f} s")
+    if any(result not in ("ran", "skipped") for result in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
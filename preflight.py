@@ -0,0 +1,104 @@
+'''file pipeline:
+preflight.py (between convert_to_links.py and download_segments.py)
+    estimate: playlist EXTINF total x bitrate of the first segments / measured throughput
+    compare with the __gda__ token expiry -> ok / warn
+    TokenSigner: signs every segment request with the current token and swaps in a
+    refreshed one mid-download (on 403/410 or shortly before expiry)
+'''
+
+
+# Imports
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+from download_segments import DEFAULT_WORKERS, download_segments
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+from split_link import VodUrl
+
+
+class TokenExpired(Exception):
+    pass
+
+
+class TokenSigner:
+    # refresh: callable returning a new m3u8 URL (or token) for the same VOD, or None to give up.
+    # A refusal is remembered: the other workers fail right away instead of asking again
+
+    def __init__(self, vod_url, refresh=None, margin=120):
+        self.vod_url = vod_url
+        self.refresh_callback = refresh
+        self.margin = margin
+        self.gave_up = False
+        self._lock = threading.Lock()
+
+    @property
+    def auth_token(self):
+        return self.vod_url.auth_token
+
+    def sign(self, url):
+        # Replace whatever token the rewritten playlist baked in with the current one
+        parts = urlsplit(url)
+        return urlunsplit(parts._replace(query=self.auth_token.lstrip("?")))
+
+    def expiring(self):
+        seconds_left = self.vod_url.seconds_left()
+        return not self.gave_up and seconds_left is not None and seconds_left < self.margin
+
+    def refresh(self, stale_token, required=True):
+        # Several workers can hit an expired token at once; only the first one asks for a new token.
+        # required=False (refresh ahead of expiry): a refusal keeps the current, still valid token
+        with self._lock:
+            if self.auth_token != stale_token:
+                return True
+            if not self.gave_up:
+                new = self.refresh_callback() if self.refresh_callback else None
+                if new:
+                    new_token = VodUrl.parse(new).auth_token if ".m3u8" in new else new
+                    self.vod_url = self.vod_url.with_token(new_token)
+                    print(f"\n-----> token refreshed, expires in {self.vod_url.seconds_left() or 0:.0f} s")
+                    return True
+                self.gave_up = True
+            if required:
+                raise TokenExpired(f"token {stale_token} expired and no refreshed URL was given")
+            return False
+
+
+class _Discard:
+    def write(self, data):
+        pass
+
+
+def preflight(playlist, signer, workers=DEFAULT_WORKERS, cache_dir=None, safety=1.5, margin=300):
+    # Fetches the first `workers` segments in parallel (into the cache, so nothing is wasted)
+    # to measure bitrate and throughput, then compares the estimate with the token expiry.
+    # An already expired token asks the signer for a refreshed URL right away
+    sample = playlist.uris[:max(1, workers)]
+    cache = None
+    if cache_dir is not None and sample:
+        cache = SegmentCache(cache_dir, vod_id_from_name(segment_name(sample[0])))
+    stats = download_segments(sample, _Discard(), workers, cache=cache, signer=signer)
+
+    sample_seconds = sum(playlist.durations[:len(sample)]) or 1e-9
+    bitrate = stats["bytes"] / sample_seconds
+    throughput = stats["bytes"] / max(stats["seconds"], 1e-9) if stats["fetched"] else None
+    estimated_bytes = bitrate * playlist.total_duration
+    estimated_seconds = estimated_bytes / throughput if throughput else None
+    seconds_left = signer.vod_url.seconds_left()
+
+    ok = seconds_left is None or estimated_seconds is None or seconds_left > estimated_seconds * safety + margin
+    return {
+        "ok": ok,
+        "estimated_bytes": estimated_bytes,
+        "estimated_seconds": estimated_seconds,
+        "throughput": throughput,
+        "seconds_left": seconds_left,
+    }
+
+
+def format_preflight(result):
+    estimate = "unknown (sample came from the cache)"
+    if result["estimated_seconds"] is not None:
+        estimate = f"{result['estimated_seconds'] / 60:.0f} min at {result['throughput'] / 1e6:.1f} MB/s"
+    left = "unknown" if result["seconds_left"] is None else f"{result['seconds_left'] / 60:.0f} min"
+    return (f"~{result['estimated_bytes'] / 1e9:.2f} GB, download {estimate}, token expires in {left}"
+            + ("" if result["ok"] else "  <-- token likely expires before the download finishes"))
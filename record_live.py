@@ -0,0 +1,141 @@
+'''file pipeline:
+record_live.py (while the live is on air)
+    poll the live m3u8 every EXT-X-TARGETDURATION
+        convert_to_links.py (parse playlist)
+        download_segments.py (new segments only)
+        append to output .ts (next media sequence kept in output .ts.sequence for --resume)
+        a failed poll or segment is logged and retried on the next poll, until --idle-timeout
+    on EXT-X-ENDLIST: ffmpeg (copy .ts to .mp4)
+
+usage:
+    python record_live.py "<live m3u8 URL>" output_live.ts [--mp4 output_mp4.mp4] [--resume]
+'''
+
+
+# Imports
+import argparse
+import http.client
+import os
+import subprocess
+import time
+from urllib.parse import urljoin, urlsplit
+
+from convert_to_links import parse_playlist
+from download_segments import DEFAULT_WORKERS, ConnectionPool, HTTPError, fetch_segment, download_segments
+
+
+# Segment lines are relative to the playlist; Weverse also needs the playlist's
+# ?__gda__ token on every segment (same rewrite as convert_to_links)
+
+def resolve_uri(playlist_url, uri):
+    url = urljoin(playlist_url, uri)
+    query = urlsplit(playlist_url).query
+    if query and not urlsplit(url).query:
+        url += "?" + query
+    return url
+
+
+def read_sequence(output_ts):
+    try:
+        with open(output_ts + ".sequence", encoding="utf-8") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_sequence(output_ts, sequence):
+    with open(output_ts + ".sequence", "w", encoding="utf-8") as f:
+        f.write(str(sequence))
+
+
+def record_live(playlist_url, output_ts, workers=DEFAULT_WORKERS, idle_timeout=None, sleep=time.sleep, resume=False):
+    # Without resume an existing output is never appended to (a second recording glued onto the first)
+    pool = ConnectionPool()
+    next_sequence = read_sequence(output_ts) if resume else None
+    stats = {"segments": 0, "bytes": 0, "missed": 0, "polls": 0, "errors": 0}
+    last_change = time.monotonic()
+    target = 4
+
+    try:
+        with open(output_ts, "ab" if resume else "xb") as output:
+            while True:
+                new_uris = []
+                try:
+                    playlist = parse_playlist(fetch_segment(pool, playlist_url).decode("utf-8").splitlines())
+                    stats["polls"] += 1
+                    target = playlist.target_duration or 4
+
+                    # Only segments with a media sequence number we have not written yet
+                    if next_sequence is None:
+                        next_sequence = playlist.media_sequence
+                    skip = next_sequence - playlist.media_sequence
+                    if skip < 0:
+                        # Segments slid out of the live window before we got to them
+                        stats["missed"] += -skip
+                        print(f"\n-----> missed {-skip} segments (sequence {next_sequence} to {playlist.media_sequence - 1})")
+                        next_sequence = playlist.media_sequence
+                        skip = 0
+                    new_uris = playlist.uris[skip:]
+
+                    if new_uris:
+                        first_sequence = next_sequence
+
+                        def written(index, data):
+                            # Advanced per segment, so a failure mid-batch resumes after the last written one
+                            nonlocal next_sequence, last_change
+                            next_sequence = first_sequence + index + 1
+                            last_change = time.monotonic()
+
+                        urls = [resolve_uri(playlist_url, uri) for uri in new_uris]
+                        try:
+                            result = download_segments(urls, output, workers, written, pool=pool)
+                        finally:
+                            output.flush()
+                            write_sequence(output_ts, next_sequence)
+                        stats["segments"] += result["segments"]
+                        stats["bytes"] += result["bytes"]
+                        print(f"\n-----> +{result['segments']} segments ({stats['segments']} total, sequence {next_sequence - 1})")
+
+                    if playlist.ended:
+                        break
+                except (HTTPError, http.client.HTTPException, OSError, UnicodeDecodeError) as error:
+                    # The live goes on: try again on the next poll, the idle timeout decides when to give up
+                    stats["errors"] += 1
+                    print(f"\n-----> poll failed ({error}), retrying")
+
+                if time.monotonic() - last_change > (idle_timeout or 10 * target):
+                    print("\n-----> playlist stopped growing without EXT-X-ENDLIST, stopping")
+                    break
+
+                # RFC 8216: wait one target duration after a change, half of it otherwise
+                sleep(target if new_uris else target / 2)
+    finally:
+        pool.close()
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a Weverse live from its growing m3u8")
+    parser.add_argument("playlist_url")
+    parser.add_argument("output_ts")
+    parser.add_argument("--mp4", help="copy the finished recording into this .mp4")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--idle-timeout", type=float, help="seconds without new segments before giving up")
+    parser.add_argument("--resume", action="store_true", help="append to an existing output after its last segment")
+    args = parser.parse_args()
+
+    if os.path.exists(args.output_ts) and not args.resume:
+        raise SystemExit(f"\n-----> {args.output_ts} already exists, pass --resume to continue it or choose another name")
+    stats = record_live(args.playlist_url, args.output_ts, args.workers, args.idle_timeout, resume=args.resume)
+    print("\n" + "="*50)
+    print(f"\n-----> {args.output_ts}: {stats['segments']} segments, {stats['bytes'] / 1e6:.1f} MB, "
+          f"{stats['missed']} missed, {stats['errors']} failed polls")
+
+    if args.mp4:
+        subprocess.run(["ffmpeg", "-y", "-i", args.output_ts, "-c", "copy", args.mp4])
+        print(f"\n-----> {args.mp4} created")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+'''file pipeline:
+repeat_detector.py (Whisper repeat loops, before "Merge lines with Same Text")
+    subtitles.py (read .srt / .vtt)
+    one pass over the cues: same text as one of the last --max-period cues,
+    or near-duplicate (character trigram overlap) -> part of a run
+    report runs, optional cleaned file, time ranges to re-transcribe
+
+usage:
+    python repeat_detector.py archive-subtitle/*.srt [--clean] [--ranges ranges.json]
+'''
+
+
+# Imports
+import argparse
+import json
+import os
+import re
+from collections import deque, namedtuple
+
+from subtitles import read_subtitles, write_subtitles, format_timestamp
+
+
+WORD_RE = re.compile(r"\w+")
+
+Seen = namedtuple("Seen", ["index", "key", "grams", "start_ms"])
+
+
+def normalize_text(text):
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)} or {text}
+
+
+def trigram_similarity(a, b):
+    return len(a & b) / len(a | b)
+
+
+# A run is a stretch of cues that each repeat one of the cues just before them,
+# e.g. A A A A or A B A B A B (period 2)
+
+def find_repeat_runs(cues, max_period=3, similarity=0.8, min_repeats=2):
+    runs = []
+    repeated = []
+    window = deque(maxlen=max_period)
+    keys = {}
+    run = None
+
+    for index, (start_ms, end_ms, text) in enumerate(cues):
+        # hash() of the normalized text is computed once per distinct string
+        key = keys.get(text)
+        if key is None:
+            normalized = normalize_text(text)
+            key = keys[text] = (hash(normalized), trigrams(normalized))
+        text_hash, grams = key
+
+        match = None
+        for seen in window:
+            if seen.key == text_hash or trigram_similarity(seen.grams, grams) >= similarity:
+                match = seen
+                break
+
+        if match is not None:
+            repeated.append(index)
+            if run is None:
+                run = {"first_cue": match.index, "start_ms": match.start_ms, "text": text, "repeats": 0}
+            run["last_cue"] = index
+            run["end_ms"] = end_ms
+            run["repeats"] += 1
+        elif run is not None:
+            runs.append(run)
+            run = None
+        window.append(Seen(index, text_hash, grams, start_ms))
+
+    if run is not None:
+        runs.append(run)
+    runs = [run for run in runs if run["repeats"] >= min_repeats]
+    in_runs = set()
+    for run in runs:
+        in_runs.update(range(run["first_cue"], run["last_cue"] + 1))
+    return runs, [index for index in repeated if index in in_runs]
+
+
+def retranscribe_ranges(runs, padding_ms=1000):
+    # Merged, padded time ranges covering every run
+    ranges = []
+    for run in sorted(runs, key=lambda run: run["start_ms"]):
+        start_ms = max(0, run["start_ms"] - padding_ms)
+        end_ms = run["end_ms"] + padding_ms
+        if ranges and start_ms <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end_ms)
+        else:
+            ranges.append([start_ms, end_ms])
+    return ranges
+
+
+def analyze_file(path, max_period=3, similarity=0.8, min_repeats=2):
+    table = read_subtitles(path)
+    runs, repeated = find_repeat_runs(table, max_period, similarity, min_repeats)
+    return table, runs, repeated
+
+
+def clean_cues(table, repeated):
+    # Keep the first time each line of a loop was said, drop the repeats
+    drop = set(repeated)
+    return [cue for index, cue in enumerate(table) if index not in drop]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find Whisper repeat loops in .srt / .vtt files")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--max-period", type=int, default=3, help="longest repeating pattern, in cues")
+    parser.add_argument("--similarity", type=float, default=0.8, help="trigram overlap counted as the same line")
+    parser.add_argument("--min-repeats", type=int, default=2, help="fewest repeated cues in a reported run")
+    parser.add_argument("--clean", action="store_true", help="write <name>_clean.<ext> without the repeats")
+    parser.add_argument("--report", help="write the full report as JSON")
+    parser.add_argument("--ranges", help="write time ranges to re-transcribe as JSON")
+    args = parser.parse_args()
+
+    report = {}
+    for path in args.files:
+        table, runs, repeated = analyze_file(path, args.max_period, args.similarity, args.min_repeats)
+        ranges = retranscribe_ranges(runs)
+        report[path] = {"cues": len(table), "repeated_cues": len(repeated), "runs": runs, "ranges": ranges}
+
+        print(f"\n{path}: {len(table)} cues, {len(repeated)} repeats in {len(runs)} runs")
+        for run in sorted(runs, key=lambda run: -run["repeats"])[:5]:
+            print(f"    {format_timestamp(run['start_ms'])} - {format_timestamp(run['end_ms'])}  "
+                  f"x{run['repeats'] + 1}  {run['text'][:40]!r}")
+
+        if args.clean:
+            name, extension = os.path.splitext(path)
+            write_subtitles(clean_cues(table, repeated), name + "_clean" + extension)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+    if args.ranges:
+        with open(args.ranges, "w", encoding="utf-8") as f:
+            json.dump({path: [{"start_ms": start, "end_ms": end} for start, end in entry["ranges"]]
+                       for path, entry in report.items()}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Imports
+import glob
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+
+# Cache layout:
+#   <cache_dir>/<vod_id>.manifest           one JSON line per stored segment
+#   <cache_dir>/<vod_id>-000123.ts          segment data
+# A VOD's segments are dropped (clear) once its .mp4 passed verify_mp4, so the cache only holds unfinished VODs
+
+def segment_name(url):
+    return urlsplit(url).path.rsplit("/", 1)[-1]
+
+
+def vod_id_from_name(name):
+    # f6f2c258-87a6-11ef-80a1-a0369ffac330-000123.ts -> f6f2c258-87a6-11ef-80a1-a0369ffac330
+    return name.rsplit("-", 1)[0]
+
+
+class SegmentCache:
+    def __init__(self, cache_dir, vod_id):
+        self.cache_dir = cache_dir
+        self.vod_id = vod_id
+        self.manifest_path = os.path.join(cache_dir, vod_id + ".manifest")
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # torn last line from an interrupted run
+                if entry.get("size") is None:
+                    self.entries.pop(entry["name"], None)
+                else:
+                    self.entries[entry["name"]] = entry
+
+    def _append(self, entry):
+        # Append-only so an interrupted run never loses earlier entries
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        try:
+            with open(self.path(name), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = None
+
+        if data is None or len(data) != entry["size"] or hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            self.discard(name)
+            return None
+        return data
+
+    def put(self, name, data):
+        tmp_path = self.path(name) + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(name))
+
+        entry = {"name": name, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+        with self._lock:
+            self.entries[name] = entry
+            self._append(entry)
+
+    def discard(self, name):
+        with self._lock:
+            if self.entries.pop(name, None) is not None:
+                self._append({"name": name, "size": None})
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            pass
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def clear(self):
+        # Returns the bytes freed
+        freed = 0
+        with self._lock:
+            pattern = os.path.join(glob.escape(self.cache_dir), glob.escape(self.vod_id) + "-*")
+            for path in glob.glob(pattern) + [self.manifest_path]:
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.entries.clear()
+        return freed
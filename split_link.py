@@ -1,19 +1,65 @@
 # Imports
+import os
+import time
+from dataclasses import dataclass, replace
 from datetime import datetime
 
-# Split the URL into variables
+# Parsed m3u8 URL: everything set_variables needs, split once
 
-def set_variables(file_url):
-    beginning, auth_token = file_url.split(".m3u8")
-    input_m3u8 = beginning.split("/")[-1] + ".m3u8"
-    base_url = file_url.split("hls/")[0] + "hls/"
+@dataclass(frozen=True)
+class VodUrl:
+    base_url: str       # https://.../weverse_2024_09_27_0/hls/
+    vod_id: str         # 81431ed9-7ce1-11ef-b614-a0369ffb34e8
+    auth_token: str     # ?__gda__=1727469565_976e9cf32cf03c5d016b356062d27dfc
+    year: str
+    month_num: str
+    day: str
+
+    @classmethod
+    def parse(cls, file_url):
+        beginning, auth_token = file_url.split(".m3u8")
+        vod_id = beginning.split("/")[-1]
+        base_url = file_url.split("hls/")[0] + "hls/"
+        year, month_num, day = beginning.split("/")[7].split("_")[1:4]
+        return cls(base_url, vod_id, auth_token, year, month_num, day)
+
+    @property
+    def input_m3u8(self):
+        return self.vod_id + ".m3u8"
+
+    @property
+    def file_url(self):
+        return self.base_url + self.input_m3u8 + self.auth_token
+
+    @property
+    def month_name(self):
+        return datetime.strptime(self.month_num, "%m").strftime("%B")
+
+    @property
+    def date(self):
+        return f"{self.year}_{self.month_name}_{self.day}"
+
+    @property
+    def expires(self):
+        # __gda__=<expiry epoch seconds>_<hash>; None if the token has another shape
+        value = self.auth_token.partition("__gda__=")[2].split("&")[0]
+        expiry = value.split("_")[0]
+        return int(expiry) if expiry.isdigit() else None
+
+    def seconds_left(self, now=None):
+        if self.expires is None:
+            return None
+        return self.expires - (time.time() if now is None else now)
 
-    year, month_num, day = beginning.split("/")[7].split("_")[1:4]
-    month_name = datetime.strptime(month_num, "%m").strftime("%B")
+    def with_token(self, auth_token):
+        return replace(self, auth_token=auth_token)
 
-    date = f"{year}_{month_name}_{day}"
 
-    return base_url, input_m3u8, auth_token, month_num, date
+# Split the URL into variables
+
+def set_variables(file_url):
+    vod_url = VodUrl.parse(file_url)
+    return vod_url.base_url, vod_url.input_m3u8, vod_url.auth_token, vod_url.month_num, vod_url.date
 
     '''
     Variable format:
@@ -26,4 +72,21 @@ def set_variables(file_url):
         ?__gda__=1727469565_976e9cf32cf03c5d016b356062d27dfc
     date:
         {year}_{month_name}_{day}
-    '''
\ No newline at end of file
+    '''
+
+
+# Same-day outputs get an index suffix: output_mp4_2024_October_23.mp4, output_mp4_2024_October_23(1).mp4, ...
+
+def output_names(date, index=0):
+    suffix = f"({index})" if index else ""
+    return "output_mp4_" + date + suffix + ".mp4", "output_mp3_" + date + suffix + ".mp3"
+
+
+def next_output_index(date, directory=".", taken=()):
+    # taken: names already handed out but not written yet (e.g. other batch jobs)
+    index = 0
+    while True:
+        names = output_names(date, index)
+        if not any(name in taken or os.path.exists(os.path.join(directory, name)) for name in names):
+            return index
+        index += 1
@@ -0,0 +1,194 @@
+'''file pipeline:
+stitch_streams.py (replaces archive-programs/edit-stream-stitch)
+    ffprobe the first part: codec, profile, level, size, frame rate, time base, audio layout
+    ffmpeg lavfi: transition card encoded with exactly those parameters
+    .mp4 parts: remuxed to MPEG-TS (h264_mp4toannexb, stream copy) so every file carries its own SPS / PPS
+    ffmpeg concat demuxer: parts + cards, stream copy only (no re-encode of the live)
+
+    playlist mode: split the VOD at EXT-X-DISCONTINUITY / jumps in segment numbers
+    (the live crashed and rejoined), download each part, stitch them
+
+usage:
+    python stitch_streams.py parts part1.mp4 part2.mp4 -o output.mp4 [--text "..."]
+    python stitch_streams.py playlist output_m3u8_<vod>.m3u8 -o output.mp4
+'''
+
+
+# Imports
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+
+from convert_to_links import read_playlist
+from download_segments import DEFAULT_WORKERS, download_segments
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+
+
+DEFAULT_TEXT = "Her stream crashed here for a moment..."
+
+# ffprobe profile names -> libx264 / aac option values
+H264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+AAC_PROFILES = {"LC": "aac_low", "HE-AAC": "aac_he", "HE-AACv2": "aac_he_v2"}
+
+
+def probe(path):
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json", path],
+        stdout=subprocess.PIPE, check=True,
+    )
+    info = json.loads(result.stdout)
+    streams = {}
+    for stream in info["streams"]:
+        streams.setdefault(stream["codec_type"], stream)
+    return streams.get("video"), streams.get("audio"), info["format"]
+
+
+def transition_command(video, audio, text, output, seconds=3, font=None):
+    # Encode the card with the same codec parameters as the live so the concat can stay a stream copy
+    fps = video.get("r_frame_rate", "30/1")
+    command = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "lavfi", "-i", f"color=c=black:s={video['width']}x{video['height']}:r={fps}:d={seconds}"]
+    if audio is not None:
+        layout = audio.get("channel_layout") or ("stereo" if audio.get("channels", 2) == 2 else "mono")
+        command += ["-f", "lavfi", "-i", f"anullsrc=r={audio['sample_rate']}:cl={layout}"]
+
+    text = text.replace("\\", "\\\\").replace("'", "\\'").replace(":", "\\:")
+    font = f"fontfile='{font}':" if font else ""
+    command += ["-vf", f"drawtext={font}text='{text}':fontcolor=white:fontsize=48:x=(w-text_w)/2:y=(h-text_h)/2",
+                "-t", str(seconds), "-c:v", "libx264", "-pix_fmt", video.get("pix_fmt", "yuv420p"), "-r", fps]
+    if video.get("profile") in H264_PROFILES:
+        command += ["-profile:v", H264_PROFILES[video["profile"]]]
+    if video.get("level", -99) > 0:
+        command += ["-level:v", f"{video['level'] / 10:.1f}"]
+    if video.get("time_base", "").startswith("1/") and not output.endswith(".ts"):
+        command += ["-video_track_timescale", video["time_base"][2:]]
+
+    if audio is not None:
+        command += ["-c:a", "aac", "-ar", str(audio["sample_rate"]), "-ac", str(audio.get("channels", 2))]
+        if audio.get("profile") in AAC_PROFILES:
+            command += ["-profile:a", AAC_PROFILES[audio["profile"]]]
+    if output.endswith(".ts"):
+        command += ["-f", "mpegts"]
+    return command + [output]
+
+
+def make_transition(reference, text, output, seconds=3, font=None):
+    video, audio, _ = probe(reference)
+    subprocess.run(transition_command(video, audio, text, output, seconds, font), check=True)
+    return output
+
+
+def remux_ts(path, output):
+    # The concat demuxer keeps the avcC (SPS / PPS) of the first file only: .mp4 inputs are rewritten to
+    # MPEG-TS with the parameter sets in the stream, so a card or a part encoded differently still decodes
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", path, "-map", "0:v", "-map", "0:a?", "-c", "copy",
+                    "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", output], check=True)
+    return output
+
+
+def stitch(parts, output, transition=None):
+    # Concat demuxer: timestamps of every file are shifted after the previous one, streams are copied
+    inputs = []
+    for number, part in enumerate(parts):
+        if number and transition:
+            inputs.append(transition)
+        inputs.append(part)
+    # Next to the output: the remuxed parts are as large as the parts
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as work_dir:
+        remuxed = {}
+        for path in inputs:
+            if not path.endswith(".ts") and path not in remuxed:
+                remuxed[path] = remux_ts(path, os.path.join(work_dir, f"part_{len(remuxed):02d}.ts"))
+        list_path = os.path.join(work_dir, "list.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in inputs:
+                f.write(f"file '{os.path.abspath(remuxed.get(path, path))}'\n")
+        command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                   "-map", "0:v", "-map", "0:a?", "-c", "copy"]
+        if not output.endswith(".ts"):
+            command += ["-bsf:a", "aac_adtstoasc"]
+        subprocess.run(command + [output], check=True)
+    return output
+
+
+# Gaps in a VOD playlist: EXT-X-DISCONTINUITY tags, or segment numbers that jump
+# (f6f2c258-...-000123.ts followed by ...-000131.ts)
+
+def _segment_number(uri):
+    number = segment_name(uri).rsplit("-", 1)[-1].split(".")[0]
+    return int(number) if number.isdigit() else None
+
+
+def find_gaps(playlist):
+    gaps = set(index for index in playlist.discontinuities if 0 < index < len(playlist))
+    previous = None
+    for index, uri in enumerate(playlist.uris):
+        number = _segment_number(uri)
+        if previous is not None and number is not None and number != previous + 1:
+            gaps.add(index)
+        previous = number
+    return sorted(gaps)
+
+
+def split_at_gaps(playlist):
+    # [(first, end)] segment index ranges without a gap inside
+    bounds = [0] + find_gaps(playlist) + [len(playlist)]
+    return [(first, end) for first, end in zip(bounds, bounds[1:]) if end > first]
+
+
+def stitch_playlist(m3u8_path, output, text=DEFAULT_TEXT, workers=DEFAULT_WORKERS, cache_dir="segment_cache",
+                    font=None, work_dir=None):
+    playlist = read_playlist(m3u8_path)
+    ranges = split_at_gaps(playlist)
+    print(f"\n-----> {len(ranges)} parts ({len(ranges) - 1} gaps)")
+
+    cache = None
+    if cache_dir and playlist.uris:
+        cache = SegmentCache(cache_dir, vod_id_from_name(segment_name(playlist.uris[0])))
+
+    work_dir = work_dir or os.path.splitext(output)[0] + "_parts"
+    os.makedirs(work_dir, exist_ok=True)
+    parts = []
+    for number, (first, end) in enumerate(ranges):
+        part = os.path.join(work_dir, f"part_{number:02d}.ts")
+        with open(part, "wb") as f:
+            download_segments(playlist.uris[first:end], f, workers, cache=cache)
+        parts.append(part)
+
+    transition = None
+    if len(parts) > 1:
+        transition = make_transition(parts[0], text, os.path.join(work_dir, "transition.ts"), font=font)
+    return stitch(parts, output, transition)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stitch live parts with a matching transition card, no re-encode")
+    parser.add_argument("--text", default=DEFAULT_TEXT)
+    parser.add_argument("--font", help="font file for the transition text")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    parts_parser = subparsers.add_parser("parts", help="stitch video files")
+    parts_parser.add_argument("parts", nargs="+")
+    parts_parser.add_argument("-o", "--output", default="output.mp4")
+
+    playlist_parser = subparsers.add_parser("playlist", help="download a VOD playlist and stitch it at its gaps")
+    playlist_parser.add_argument("m3u8", help="rewritten playlist (output_m3u8_*.m3u8)")
+    playlist_parser.add_argument("-o", "--output", default="output.mp4")
+    playlist_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    playlist_parser.add_argument("--cache-dir", default="segment_cache")
+    args = parser.parse_args()
+
+    if args.mode == "parts":
+        transition = None
+        if len(args.parts) > 1:
+            transition = make_transition(args.parts[0], args.text, "transition.ts", font=args.font)
+        stitch(args.parts, args.output, transition)
+    else:
+        stitch_playlist(args.m3u8, args.output, args.text, args.workers, args.cache_dir, args.font)
+    print(f"\n-----> {args.output} created")
+
+
+if __name__ == "__main__":
+    main()
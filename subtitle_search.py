@@ -0,0 +1,227 @@
+'''file pipeline:
+subtitle_search.py (instead of grepping archive-subtitle/ and working out timecodes by hand)
+    index: .srt / .vtt -> subtitles.py -> SQLite FTS5, trigram tokenizer (Korean has no spaces to split on)
+        only new or changed files are read again, deleted files are dropped
+    search: file, cue number, start/end in ms for every matching cue
+    clip: cut the matching part out of the .mp4 with stream copy (library.py or a sibling output_mp4_*.mp4)
+
+usage:
+    python subtitle_search.py index archive-subtitle
+    python subtitle_search.py search "언니" [--limit 20] [--file kazuha]
+    python subtitle_search.py clip "makeup challenge" [--hit 1] [--pad 3] [-o clip.mp4] [--media output.mp4]
+'''
+
+
+# Imports
+import argparse
+import glob
+import os
+import sqlite3
+import subprocess
+import time
+import unicodedata
+
+from library import OUTPUT_RE, Library, parse_name
+from subtitles import format_timestamp, read_subtitles
+
+
+SUBTITLE_EXTENSIONS = (".srt", ".vtt")
+
+
+def normalize_text(text):
+    # NFC so precomposed and decomposed Hangul match, one line per cue
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class SubtitleIndex:
+    def __init__(self, path="subtitle_index.sqlite"):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS cues (
+                id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, cue INTEGER NOT NULL,
+                start_ms INTEGER NOT NULL, end_ms INTEGER NOT NULL, text TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS cues_file ON cues (file_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS cues_fts USING fts5(
+                text, content='cues', content_rowid='id', tokenize='trigram');
+        """)
+
+    def _drop(self, file_id):
+        # External-content FTS: rows are removed from the index with the text they were indexed with
+        self.db.execute("INSERT INTO cues_fts (cues_fts, rowid, text) "
+                        "SELECT 'delete', id, text FROM cues WHERE file_id = ?", (file_id,))
+        self.db.execute("DELETE FROM cues WHERE file_id = ?", (file_id,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def add_file(self, path):
+        # Returns the number of cues indexed, or None if the file is unchanged
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.db.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+        if known is not None:
+            if known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                return None
+            self._drop(known["id"])
+
+        table = read_subtitles(path)
+        texts = [normalize_text(text) for text in table.texts]
+        file_id = self.db.execute("INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                                  (path, stat.st_size, stat.st_mtime_ns)).lastrowid
+        (first_id,) = self.db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM cues").fetchone()
+        rows = [(first_id + number, file_id, number + 1, start_ms, end_ms, texts[text_id])
+                for number, (start_ms, end_ms, text_id) in enumerate(table.rows())]
+        self.db.executemany("INSERT INTO cues VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.db.execute("INSERT INTO cues_fts (rowid, text) SELECT id, text FROM cues WHERE file_id = ?", (file_id,))
+        return len(rows)
+
+    def update(self, paths):
+        # paths: files and directories; files indexed before under these directories but gone now are dropped
+        files = set()
+        directories = []
+        for path in paths:
+            if os.path.isdir(path):
+                directories.append(os.path.abspath(path))
+                for extension in SUBTITLE_EXTENSIONS:
+                    files.update(os.path.abspath(name) for name in
+                                 glob.glob(os.path.join(glob.escape(path), "**", "*" + extension), recursive=True))
+            elif path.lower().endswith(SUBTITLE_EXTENSIONS):
+                files.add(os.path.abspath(path))
+
+        stats = {"files": len(files), "indexed": 0, "cues": 0, "dropped": 0}
+        for path in sorted(files):
+            count = self.add_file(path)
+            if count is not None:
+                stats["indexed"] += 1
+                stats["cues"] += count
+        for directory in directories:
+            for row in self.db.execute("SELECT id, path FROM files WHERE path LIKE ?",
+                                       (directory.rstrip(os.sep) + os.sep + "%",)).fetchall():
+                if row["path"] not in files:
+                    self._drop(row["id"])
+                    stats["dropped"] += 1
+        self.db.commit()
+        return stats
+
+    def search(self, query, limit=20, file_filter=None):
+        # Trigram MATCH needs at least 3 characters; shorter (2-syllable Korean) queries scan the cue table
+        query = normalize_text(query)
+        if not query:
+            return []
+        filter_sql = ""
+        args = []
+        if file_filter:
+            filter_sql = " AND files.path LIKE ?"
+            args.append(f"%{file_filter}%")
+
+        if len(query) >= 3:
+            sql = ("SELECT files.path, cues.cue, cues.start_ms, cues.end_ms, cues.text FROM cues_fts "
+                   "JOIN cues ON cues.id = cues_fts.rowid JOIN files ON files.id = cues.file_id "
+                   f"WHERE cues_fts MATCH ?{filter_sql} ORDER BY files.path, cues.cue LIMIT ?")
+            args = ['"' + query.replace('"', '""') + '"'] + args
+        else:
+            sql = ("SELECT files.path, cues.cue, cues.start_ms, cues.end_ms, cues.text FROM cues "
+                   f"JOIN files ON files.id = cues.file_id WHERE instr(lower(cues.text), lower(?)) > 0{filter_sql} "
+                   "ORDER BY files.path, cues.cue LIMIT ?")
+            args = [query] + args
+        return self.db.execute(sql, args + [limit]).fetchall()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+# Clips: the .mp4 for a subtitle file is looked up in the library (same date and same-day index),
+# then next to the subtitle (output_mp3_2024_October_11_kazuha.srt -> output_mp4_2024_October_11.mp4)
+
+def find_media(subtitle_path, library_dir="library"):
+    info = parse_name(subtitle_path)
+    if info["date"] and os.path.isdir(library_dir):
+        library = Library(library_dir)
+        try:
+            for row in library.find(date=info["date"], kind="video"):
+                if row["same_day_index"] == info["same_day_index"] and os.path.exists(row["path"]):
+                    return row["path"]
+        finally:
+            library.close()
+
+    match = OUTPUT_RE.match(os.path.splitext(os.path.basename(subtitle_path))[0])
+    if match:
+        year, month, day, index, _ = match.groups()
+        name = f"output_mp4_{year}_{month}_{day}" + (f"({index})" if index else "") + ".mp4"
+        for directory in (os.path.dirname(subtitle_path), "."):
+            if os.path.exists(os.path.join(directory, name)):
+                return os.path.join(directory, name)
+    return None
+
+
+def cut_clip(media_path, start_ms, end_ms, output, pad_seconds=3):
+    # Stream copy: the clip starts at the keyframe before start - pad, no re-encode
+    start = max(0, start_ms / 1000 - pad_seconds)
+    duration = end_ms / 1000 + pad_seconds - start
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-ss", f"{start:.3f}", "-i", media_path,
+                    "-t", f"{duration:.3f}", "-map", "0:v?", "-map", "0:a?", "-c", "copy",
+                    "-avoid_negative_ts", "make_zero", output], check=True)
+    return output
+
+
+def format_hit(number, row):
+    start = format_timestamp(row["start_ms"])
+    end = format_timestamp(row["end_ms"])
+    return f"[{number}] {os.path.basename(row['path'])} #{row['cue']}  {start} --> {end}  {row['text']}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search over the subtitle archive")
+    parser.add_argument("--db", default="subtitle_index.sqlite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="add new / changed subtitle files")
+    index_parser.add_argument("paths", nargs="+", help="directories or .srt / .vtt files")
+
+    for name in ("search", "clip"):
+        command_parser = subparsers.add_parser(name)
+        command_parser.add_argument("query")
+        command_parser.add_argument("--limit", type=int, default=20)
+        command_parser.add_argument("--file", help="only files whose path contains this")
+        if name == "clip":
+            command_parser.add_argument("--hit", type=int, default=1, help="number of the search hit to cut")
+            command_parser.add_argument("--pad", type=float, default=3, help="seconds before and after the cue")
+            command_parser.add_argument("--media", help=".mp4 to cut from (default: found from the subtitle name)")
+            command_parser.add_argument("--library", default="library")
+            command_parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    index = SubtitleIndex(args.db)
+    try:
+        start = time.perf_counter()
+        if args.command == "index":
+            stats = index.update(args.paths)
+            print(f"\n-----> {stats['indexed']} of {stats['files']} files indexed ({stats['cues']} cues), "
+                  f"{stats['dropped']} dropped in {time.perf_counter() - start:.2f} s")
+            return
+
+        hits = index.search(args.query, args.limit, args.file)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if args.command == "search":
+            for number, row in enumerate(hits, 1):
+                print(format_hit(number, row))
+            print(f"\n-----> {len(hits)} hits in {elapsed_ms:.1f} ms")
+            return
+
+        if not 1 <= args.hit <= len(hits):
+            raise SystemExit(f"\n-----> no hit {args.hit} for {args.query!r} ({len(hits)} hits)")
+        row = hits[args.hit - 1]
+        print(format_hit(args.hit, row))
+        media = args.media or find_media(row["path"], args.library)
+        if media is None:
+            raise SystemExit(f"\n-----> no .mp4 found for {row['path']}, pass --media")
+        output = args.output or f"clip_{os.path.splitext(os.path.basename(row['path']))[0]}_{row['cue']}.mp4"
+        print(f"\n-----> {cut_clip(media, row['start_ms'], row['end_ms'], output, args.pad)} created from {media}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
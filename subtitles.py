@@ -0,0 +1,282 @@
+'''file pipeline:
+subtitles.py (replaces the manual SubtitleEdit pass, README step 5)
+    read .srt / .vtt into a CueTable
+    passes, chained so the cues are walked once:
+        fix_common_errors
+        multiple_replace
+        merge_same_text
+        merge_short_lines
+        beautify_timecodes
+    write .srt / .vtt
+
+usage:
+    python subtitles.py output_mp3_2024_October_05.srt [output.srt] [--replace replacements.json]
+'''
+
+
+# Imports
+import argparse
+import json
+import re
+import sys
+from array import array
+
+
+# Cue table: start/end in integer milliseconds in arrays, text stored once per distinct
+# string (Whisper repeats the same line a lot) and referenced by id
+
+class CueTable:
+    __slots__ = ("starts", "ends", "text_ids", "texts", "_ids")
+
+    def __init__(self, texts=None, ids=None):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.text_ids = array("l")
+        # Text pool is append-only, so tables made by passes can share it with their source
+        self.texts = [] if texts is None else texts
+        self._ids = {} if ids is None else ids
+
+    def intern(self, text):
+        text_id = self._ids.get(text)
+        if text_id is None:
+            text_id = self._ids[text] = len(self.texts)
+            self.texts.append(text)
+        return text_id
+
+    def append(self, start_ms, end_ms, text_id):
+        self.starts.append(start_ms)
+        self.ends.append(end_ms)
+        self.text_ids.append(text_id)
+
+    def add(self, start_ms, end_ms, text):
+        self.append(start_ms, end_ms, self.intern(text))
+
+    def derived(self):
+        return CueTable(self.texts, self._ids)
+
+    def rows(self):
+        return zip(self.starts, self.ends, self.text_ids)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        texts = self.texts
+        for start_ms, end_ms, text_id in self.rows():
+            yield start_ms, end_ms, texts[text_id]
+
+
+# Reading
+
+CUE_RE = re.compile(
+    r"(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})[ \t]+-->[ \t]+(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})[^\n]*\n"
+    r"((?:[^\n]*\S[^\n]*\n?)*)",    # text: zero or more non-blank lines, so an empty cue ends at the blank line
+)
+
+
+def parse_subtitles(content):
+    # SRT and WebVTT share the cue layout; numbers, WEBVTT header and NOTE blocks are skipped
+    table = CueTable()
+    content = content.lstrip("\ufeff").replace("\r\n", "\n")
+    for h1, m1, s1, ms1, h2, m2, s2, ms2, text in CUE_RE.findall(content):
+        start_ms = ((int(h1 or 0) * 60 + int(m1)) * 60 + int(s1)) * 1000 + int(ms1)
+        end_ms = ((int(h2 or 0) * 60 + int(m2)) * 60 + int(s2)) * 1000 + int(ms2)
+        table.add(start_ms, end_ms, text.strip())
+    return table
+
+
+def read_subtitles(path):
+    with open(path, encoding="utf-8-sig") as f:
+        return parse_subtitles(f.read())
+
+
+# Writing (cues are any iterable of (start_ms, end_ms, text), including a CueTable)
+
+def format_timestamp(ms, separator=","):
+    hours, ms = divmod(int(ms), 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}"
+
+
+def format_srt_cue(number, start_ms, end_ms, text):
+    return f"{number}\n{format_timestamp(start_ms)} --> {format_timestamp(end_ms)}\n{text}\n\n"
+
+
+def format_vtt_cue(start_ms, end_ms, text):
+    return f"{format_timestamp(start_ms, '.')} --> {format_timestamp(end_ms, '.')}\n{text}\n\n"
+
+
+def write_srt(cues, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(format_srt_cue(number, start_ms, end_ms, text)
+                        for number, (start_ms, end_ms, text) in enumerate(cues, 1)))
+
+
+def write_vtt(cues, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n" + "".join(format_vtt_cue(start_ms, end_ms, text) for start_ms, end_ms, text in cues))
+
+
+def write_subtitles(cues, path):
+    if path.lower().endswith(".vtt"):
+        write_vtt(cues, path)
+    else:
+        write_srt(cues, path)
+
+
+# Passes: each takes the table (for its text pool) and an iterator of (start_ms, end_ms, text_id)
+# and yields the same; apply_passes chains the generators so the cues are walked once.
+# Text edits are done once per distinct text id, not once per cue.
+
+def _map_texts(table, edit):
+    cache = {}
+
+    def mapped(text_id):
+        new_id = cache.get(text_id)
+        if new_id is None:
+            new_id = cache[text_id] = table.intern(edit(table.texts[text_id]))
+        return new_id
+    return mapped
+
+
+SPACE_RE = re.compile(r"[ \t]{2,}")
+SPACE_BEFORE_PUNCTUATION_RE = re.compile(r" +([,.!?])")
+
+
+def _fix_text(text):
+    lines = [SPACE_BEFORE_PUNCTUATION_RE.sub(r"\1", SPACE_RE.sub(" ", line.strip())) for line in text.split("\n")]
+    return "\n".join(line for line in lines if line)
+
+
+def fix_common_errors():
+    # Whitespace and punctuation spacing, empty cues, cues with no duration
+    def fix(table, cues):
+        mapped = _map_texts(table, _fix_text)
+        empty = table.intern("")
+        for start_ms, end_ms, text_id in cues:
+            text_id = mapped(text_id)
+            if text_id != empty and end_ms > start_ms:
+                yield start_ms, end_ms, text_id
+    return fix
+
+
+def multiple_replace(replacements, regex=False):
+    # replacements: {find: replace}, applied in order
+    if regex:
+        rules = [(re.compile(find), replace) for find, replace in replacements.items()]
+    else:
+        rules = [(re.compile(re.escape(find)), replace) for find, replace in replacements.items()]
+
+    def edit(text):
+        for pattern, replace in rules:
+            text = pattern.sub(replace, text)
+        return text
+
+    def replace_pass(table, cues):
+        mapped = _map_texts(table, edit)
+        for start_ms, end_ms, text_id in cues:
+            yield start_ms, end_ms, mapped(text_id)
+    return replace_pass
+
+
+def merge_same_text(max_gap_ms=1000):
+    # Consecutive cues with the same text become one cue
+    def merge(table, cues):
+        current = None
+        for cue in cues:
+            if current is not None and cue[2] == current[2] and cue[0] - current[1] <= max_gap_ms:
+                current = (current[0], max(current[1], cue[1]), current[2])
+                continue
+            if current is not None:
+                yield current
+            current = cue
+        if current is not None:
+            yield current
+    return merge
+
+
+def merge_short_lines(max_chars=43, max_gap_ms=250, max_duration_ms=7000):
+    # Neighbouring short cues become one line if the result still fits on screen
+    def merge(table, cues):
+        texts = table.texts
+        current = None
+        for cue in cues:
+            if current is not None and cue[0] - current[1] <= max_gap_ms and cue[1] - current[0] <= max_duration_ms:
+                joined = texts[current[2]] + " " + texts[cue[2]]
+                if len(joined) <= max_chars and "\n" not in joined:
+                    current = (current[0], cue[1], table.intern(joined))
+                    continue
+            if current is not None:
+                yield current
+            current = cue
+        if current is not None:
+            yield current
+    return merge
+
+
+def beautify_timecodes(fps=30, min_gap_frames=2, min_duration_ms=700):
+    # Snap to frames, keep a minimum gap between cues and a minimum duration where there is room
+    frame_ms = 1000 / fps
+    min_gap_ms = round(min_gap_frames * frame_ms)
+
+    def snap(ms):
+        return round(round(ms / frame_ms) * frame_ms)
+
+    def beautify(table, cues):
+        previous = None
+        for start_ms, end_ms, text_id in cues:
+            cue = [snap(start_ms), snap(end_ms), text_id]
+            if previous is not None:
+                if previous[1] > cue[0] - min_gap_ms:
+                    # Overlap: end the earlier cue before the later one, but keep at least one frame of it
+                    # and start the later cue after it when the two start (almost) together
+                    previous[1] = max(snap(previous[0] + frame_ms), cue[0] - min_gap_ms)
+                    cue[0] = max(cue[0], previous[1] + min_gap_ms)
+                    cue[1] = max(cue[1], snap(cue[0] + frame_ms))
+                elif previous[1] - previous[0] < min_duration_ms:
+                    previous[1] = min(previous[0] + min_duration_ms, cue[0] - min_gap_ms)
+                yield tuple(previous)
+            previous = cue
+        if previous is not None:
+            previous[1] = max(previous[1], previous[0] + min_duration_ms)
+            yield tuple(previous)
+    return beautify
+
+
+DEFAULT_PASSES = (fix_common_errors(), merge_same_text(), merge_short_lines(), beautify_timecodes())
+
+
+def apply_passes(table, passes=DEFAULT_PASSES):
+    # The passes walk the cues in time order; Whisper output is not always sorted by start
+    cues = sorted(table.rows(), key=lambda cue: (cue[0], cue[1]))
+    for subtitle_pass in passes:
+        cues = subtitle_pass(table, cues)
+
+    result = table.derived()
+    for start_ms, end_ms, text_id in cues:
+        result.append(start_ms, end_ms, text_id)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SubtitleEdit-style clean-up for .srt / .vtt")
+    parser.add_argument("input")
+    parser.add_argument("output", nargs="?", help="default: overwrite input")
+    parser.add_argument("--replace", help="JSON file with {\"find\": \"replace\"} pairs")
+    args = parser.parse_args()
+
+    passes = [fix_common_errors()]
+    if args.replace:
+        with open(args.replace, encoding="utf-8") as f:
+            passes.append(multiple_replace(json.load(f)))
+    passes += [merge_same_text(), merge_short_lines(), beautify_timecodes()]
+
+    table = read_subtitles(args.input)
+    result = apply_passes(table, passes)
+    write_subtitles(result, args.output or args.input)
+    print(f"\n-----> {len(table)} cues -> {len(result)} cues", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+'''file pipeline:
+telemetry.py (used by Main.py, batch.py, get_live_messages.py)
+    RunLog.stage(...): wall time, bytes in/out, segments/s, exit status per stage
+    run_log.jsonl: one JSON line per stage, grouped by run id
+    ffmpeg -progress pipe:1 -> live progress line
+'''
+
+
+# Imports
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+def file_size(*paths):
+    return sum(os.path.getsize(path) for path in paths if path and os.path.exists(path))
+
+
+class Stage:
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.segments = 0
+        self.returncode = None
+
+
+class RunLog:
+    def __init__(self, path="run_log.jsonl", run_id=None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        # Stages of parallel batch jobs share one log
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    @contextmanager
+    def stage(self, name, **fields):
+        # The body fills in bytes_in / bytes_out / segments / returncode on the yielded Stage
+        stage = Stage(name, **fields)
+        started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        start = time.perf_counter()
+        error = None
+        try:
+            yield stage
+        except BaseException as exception:
+            error = f"{type(exception).__name__}: {exception}"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if error is not None:
+                status = "error"
+            elif stage.returncode not in (None, 0):
+                status = "failed"
+            else:
+                status = "ok"
+            record = {
+                "run": self.run_id,
+                "stage": name,
+                "started_at": started_at,
+                "wall_seconds": round(seconds, 3),
+                "bytes_in": stage.bytes_in,
+                "bytes_out": stage.bytes_out,
+                "segments": stage.segments,
+                "segments_per_second": round(stage.segments / seconds, 2) if stage.segments and seconds else None,
+                "mb_per_second": round(stage.bytes_in / 1e6 / seconds, 2) if stage.bytes_in and seconds else None,
+                "returncode": stage.returncode,
+                "status": status,
+            }
+            if error is not None:
+                record["error"] = error
+            record.update(stage.fields)
+            self.write(record)
+
+
+# ffmpeg -progress writes key=value lines, each block ending with progress=continue|end
+
+def progress_command(command):
+    return command[:1] + ["-progress", "pipe:1", "-nostats"] + command[1:]
+
+
+def read_progress(stream, callback):
+    block = {}
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        key, _, value = line.strip().partition("=")
+        if not key:
+            continue
+        block[key] = value
+        if key == "progress":
+            callback(block)
+            block = {}
+
+
+def print_progress(block):
+    try:
+        out_seconds = int(block.get("out_time_us") or block.get("out_time_ms") or 0) / 1e6
+    except ValueError:
+        out_seconds = 0.0
+    minutes, seconds = divmod(int(out_seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    size = int(block.get("total_size", "0") or 0) if block.get("total_size", "N/A") != "N/A" else 0
+    sys.stderr.write(f"\r    {hours:02d}:{minutes:02d}:{seconds:02d}  {size / 1e6:8.1f} MB  "
+                     f"speed {block.get('speed', '?').strip():>8}  {block.get('progress', '')}   ")
+    if block.get("progress") == "end":
+        sys.stderr.write("\n")
+    sys.stderr.flush()
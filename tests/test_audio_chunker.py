@@ -0,0 +1,33 @@
+from audio_chunker import BYTES_PER_SAMPLE, PcmChunker, keep_cues
+
+RATE = 100     # samples per second, small so the byte counts stay readable
+
+
+def chunks_for(seconds, chunk_seconds=30, overlap_seconds=1, feed_seconds=7):
+    emitted = []
+    chunker = PcmChunker(emitted.append, chunk_seconds, overlap_seconds, RATE)
+    pcm = bytes(int(seconds * RATE) * BYTES_PER_SAMPLE)
+    step = int(feed_seconds * RATE) * BYTES_PER_SAMPLE
+    for start in range(0, len(pcm), step):
+        chunker.feed(pcm[start:start + step])
+    chunker.finish()
+    return emitted
+
+
+def test_final_chunk_is_last_when_the_rest_is_inside_the_overlap():
+    # 59 s: chunk 1 covers 29..59 s and nothing new follows it
+    chunks = chunks_for(59)
+    assert [(chunk.index, chunk.start_ms, chunk.last) for chunk in chunks] == [(0, 0, False), (1, 29000, True)]
+    cues = [(29.8, 30.0, "end of the stream")]     # starts at 58.8 s, inside the final overlap / 2
+    assert keep_cues(chunks[-1], cues, 1000, 30000) == [(58800, 59000, "end of the stream")]
+
+
+def test_rest_longer_than_the_overlap_gets_its_own_last_chunk():
+    chunks = chunks_for(70)
+    assert [(chunk.start_ms, chunk.last) for chunk in chunks] == [(0, False), (29000, False), (58000, True)]
+    assert len(chunks[-1].pcm) == 12 * RATE * BYTES_PER_SAMPLE
+
+
+def test_short_and_empty_streams():
+    assert [(chunk.start_ms, chunk.last) for chunk in chunks_for(10)] == [(0, True)]
+    assert chunks_for(0) == [None]
@@ -0,0 +1,84 @@
+import glob
+import io
+import os
+import threading
+from urllib.parse import urlsplit
+
+from convert_to_links import read_playlist
+from download_segments import download_segments
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def archived_urls(base):
+    # The archived playlist with its CDN host swapped for the local server
+    playlist = read_playlist(glob.glob(os.path.join(ROOT, "archive-m3u8", "*.m3u8"))[0])
+    return [base + urlsplit(uri).path + "?" + urlsplit(uri).query for uri in playlist.uris]
+
+
+def segment_data(path):
+    return b"\x47" + segment_name(path).encode() * 20
+
+
+class SegmentServer:
+    def __init__(self, failing=()):
+        self.failing = dict.fromkeys(failing, 1)    # segment name -> 503s still to send
+        self.lock = threading.Lock()
+
+    def __call__(self, path):
+        name = segment_name(path)
+        with self.lock:
+            if self.failing.get(name):
+                self.failing[name] -= 1
+                return 503, b""
+        return 200, segment_data(path)
+
+
+def test_archived_playlist_downloads_in_order_over_keep_alive(serve):
+    base, server = serve(SegmentServer())
+    urls = archived_urls(base)
+    output = io.BytesIO()
+    stats = download_segments(urls, output, 8)
+    assert output.getvalue() == b"".join(segment_data(url) for url in urls)
+    assert stats["segments"] == stats["fetched"] == len(urls) == 404
+    assert len(server.connections) <= 8
+
+
+def test_transient_errors_are_retried(serve):
+    base, server = serve(SegmentServer(failing={"f6f2c258-87a6-11ef-80a1-a0369ffac330-000003.ts"}))
+    urls = archived_urls(base)[:10]
+    output = io.BytesIO()
+    download_segments(urls, output, 4)
+    assert output.getvalue() == b"".join(segment_data(url) for url in urls)
+    assert len(server.requests) == 11
+
+
+def test_cache_skips_stored_segments_and_refetches_damaged_ones(serve, tmp_path):
+    base, server = serve(SegmentServer())
+    urls = archived_urls(base)[:50]
+    vod_id = vod_id_from_name(segment_name(urls[0]))
+    download_segments(urls, io.BytesIO(), 4, cache=SegmentCache(str(tmp_path), vod_id))
+
+    damaged = segment_name(urls[7])
+    with open(tmp_path / damaged, "r+b") as f:
+        f.write(b"x")
+    server.requests.clear()
+    output = io.BytesIO()
+    stats = download_segments(urls, output, 4, cache=SegmentCache(str(tmp_path), vod_id))
+    assert output.getvalue() == b"".join(segment_data(url) for url in urls)
+    assert (stats["cached"], stats["fetched"]) == (49, 1)
+    assert [segment_name(path) for path in server.requests] == [damaged]
+
+
+def test_clear_removes_only_this_vods_segments(serve, tmp_path):
+    base, server = serve(SegmentServer())
+    urls = archived_urls(base)[:10]
+    vod_id = vod_id_from_name(segment_name(urls[0]))
+    download_segments(urls, io.BytesIO(), 4, cache=SegmentCache(str(tmp_path), vod_id))
+    (tmp_path / "other-000001.ts").write_bytes(b"\x47")
+
+    freed = SegmentCache(str(tmp_path), vod_id).clear()
+    assert freed >= sum(len(segment_data(url)) for url in urls)
+    assert sorted(os.listdir(tmp_path)) == ["other-000001.ts"]
+    assert SegmentCache(str(tmp_path), vod_id).entries == {}
@@ -0,0 +1,65 @@
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from get_live_messages import Throttle, fetch_live_chat
+
+
+class ChatServer:
+    # `pages` pages of 3 messages, cursor in ?after=; every `rate_limit_every`-th request gets a 429
+    def __init__(self, pages=5, rate_limit_every=3, repeat_cursor=False):
+        self.pages = pages
+        self.rate_limit_every = rate_limit_every
+        self.repeat_cursor = repeat_cursor
+        self.count = 0
+        self.cursors = []
+        self.lock = threading.Lock()
+
+    def __call__(self, path):
+        with self.lock:
+            self.count += 1
+            if self.rate_limit_every and self.count % self.rate_limit_every == 0:
+                return 429, b"", {"Retry-After": "0"}
+        page = int(parse_qs(urlsplit(path).query).get("after", ["0"])[0])
+        self.cursors.append(page)
+        messages = [{"messageId": page * 3 + number, "content": f"message {page * 3 + number}"} for number in range(3)]
+        body = {"data": messages, "paging": {}}
+        if self.repeat_cursor:
+            body["paging"]["nextParams"] = {"after": "1"}
+        elif page + 1 < self.pages:
+            body["paging"]["nextParams"] = {"after": str(page + 1)}
+        return 200, json.dumps(body).encode(), {"Content-Type": "application/json"}
+
+
+def message_ids(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["messageId"] for line in f]
+
+
+def test_pages_are_followed_through_rate_limits(serve, tmp_path):
+    chat = ChatServer()
+    base, _ = serve(chat)
+    output = str(tmp_path / "live_chat.ndjson")
+    stats = fetch_live_chat(base + "/chat/v1/messages", {"limit": "3"}, output, throttle=Throttle(min_delay=0))
+    assert message_ids(output) == list(range(15))
+    assert stats["pages"] == 5 and chat.count > 5
+
+
+def test_interrupted_collection_resumes_from_the_cursor(serve, tmp_path):
+    chat = ChatServer(rate_limit_every=0)
+    base, _ = serve(chat)
+    output = str(tmp_path / "live_chat.ndjson")
+    fetch_live_chat(base + "/chat/v1/messages", {}, output, throttle=Throttle(min_delay=0), max_pages=2)
+    chat.cursors.clear()
+    stats = fetch_live_chat(base + "/chat/v1/messages", {}, output, throttle=Throttle(min_delay=0))
+    assert chat.cursors == [2, 3, 4]
+    assert message_ids(output) == list(range(15))
+    assert stats["duplicates"] == 0
+
+
+def test_repeated_cursor_stops(serve, tmp_path):
+    chat = ChatServer(rate_limit_every=0, repeat_cursor=True)
+    base, _ = serve(chat)
+    output = str(tmp_path / "live_chat.ndjson")
+    stats = fetch_live_chat(base + "/chat/v1/messages", {}, output, throttle=Throttle(min_delay=0), max_pages=50)
+    assert stats["pages"] == 2
@@ -0,0 +1,54 @@
+import os
+
+from library import Library
+from split_link import next_output_index, output_names
+
+DATE = "2024_October_11"
+
+
+def names_for(directory):
+    def names_for_index(index):
+        index = next_output_index(DATE, str(directory)) if index is None else index
+        return {extension: str(directory / name) for extension, name in zip((".mp4", ".mp3"), output_names(DATE, index))}
+    return names_for_index
+
+
+def archive(tmp_path):
+    for name, data in (("output_mp4_2024_October_11.mp4", "video"), ("output_mp3_2024_October_11.mp3", "audio")):
+        (tmp_path / name).write_text(data)
+    library = Library(str(tmp_path / "library"))
+    library.ingest_files([str(tmp_path / "output_mp4_2024_October_11.mp4"),
+                          str(tmp_path / "output_mp3_2024_October_11.mp3")], "vod")
+    return library
+
+
+def test_objects_are_separate_from_working_files(tmp_path):
+    library = archive(tmp_path)
+    entry = library.lookup("vod", ".mp4")
+    (tmp_path / "output_mp4_2024_October_11.mp4").write_text("rewritten in place")
+    with open(library.object_path(entry["sha256"], ".mp4")) as f:
+        assert f.read() == "video"
+
+
+def test_rerun_keeps_the_archived_index(tmp_path):
+    library = archive(tmp_path)
+    names, placed = library.restore_outputs("vod", [".mp4", ".mp3"], names_for(tmp_path))
+    assert [action for _, action in placed] == ["in place", "in place"]
+
+    os.remove(tmp_path / "output_mp4_2024_October_11.mp4")
+    names, placed = library.restore_outputs("vod", [".mp4", ".mp3"], names_for(tmp_path))
+    assert placed[0] == (str(tmp_path / "output_mp4_2024_October_11.mp4"), "restored")
+    assert not os.path.exists(tmp_path / "output_mp4_2024_October_11(1).mp4")
+
+
+def test_unverified_and_missing_objects_are_not_restored(tmp_path):
+    library = archive(tmp_path)
+    (tmp_path / "broken.mp4").write_text("short")
+    library.ingest_files([str(tmp_path / "broken.mp4")], "other", unverified=[str(tmp_path / "broken.mp4")])
+    assert library.lookup("other", ".mp4") is None
+
+    entry = library.lookup("vod", ".mp3")
+    path = library.object_path(entry["sha256"], ".mp3")
+    os.chmod(path, 0o644)
+    os.remove(path)
+    assert library.lookup("vod", ".mp3") is None
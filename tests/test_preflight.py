@@ -0,0 +1,44 @@
+import io
+import time
+
+import pytest
+
+from download_segments import download_segments
+from preflight import TokenExpired, TokenSigner
+from split_link import VodUrl
+
+
+def vod_url(base, seconds_left):
+    return VodUrl.parse(f"{base}/a/b/c/d/weverse_2024_10_11_0/hls/vod.m3u8"
+                        f"?__gda__={int(time.time() + seconds_left)}_deadbeef")
+
+
+def test_declined_refresh_is_asked_once(serve):
+    base, _ = serve(lambda path: (403, b""))
+    prompts = []
+    signer = TokenSigner(vod_url(base, 3600), refresh=lambda: prompts.append(1) or time.sleep(0.1))
+    urls = [f"{base}/a/b/c/d/weverse_2024_10_11_0/hls/seg{i}.ts" for i in range(40)]
+    with pytest.raises(TokenExpired):
+        download_segments(urls, io.BytesIO(), 8, signer=signer)
+    assert len(prompts) == 1
+
+
+def test_refresh_swaps_the_token(serve):
+    base, server = serve(lambda path: (200, b"ok") if "new" in path else (403, b""))
+    signer = TokenSigner(vod_url(base, 3600), refresh=lambda: "?__gda__=1_new")
+    urls = [f"{base}/a/b/c/d/weverse_2024_10_11_0/hls/seg{i}.ts" for i in range(4)]
+    output = io.BytesIO()
+    download_segments(urls, output, 2, signer=signer)
+    assert output.getvalue() == b"ok" * 4
+    assert signer.auth_token == "?__gda__=1_new"
+
+
+def test_declined_early_refresh_keeps_the_valid_token(serve):
+    base, _ = serve(lambda path: (200, b"ok"))
+    prompts = []
+    signer = TokenSigner(vod_url(base, 60), refresh=lambda: prompts.append(1), margin=120)
+    urls = [f"{base}/a/b/c/d/weverse_2024_10_11_0/hls/seg{i}.ts" for i in range(8)]
+    output = io.BytesIO()
+    download_segments(urls, output, 4, signer=signer)
+    assert output.getvalue() == b"ok" * 8
+    assert len(prompts) == 1
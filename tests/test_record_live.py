@@ -0,0 +1,72 @@
+import os
+import threading
+
+import pytest
+
+from record_live import record_live
+
+
+class LiveServer:
+    # A live window of 3 segments that grows by one segment per playlist poll, ends after `total`
+    def __init__(self, total=8, failing=()):
+        self.total = total
+        self.failing = set(failing)     # request paths that fail once with 404
+        self.polls = 0
+        self.lock = threading.Lock()
+
+    def playlist(self):
+        with self.lock:
+            self.polls += 1
+            end = min(self.polls + 2, self.total)
+        first = max(0, end - 3)
+        lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:2", f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+        for sequence in range(first, end):
+            lines += ["#EXTINF:2.0,", f"seg{sequence}.ts"]
+        if end == self.total:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines).encode()
+
+    def __call__(self, path):
+        path = path.split("?")[0]
+        with self.lock:
+            if path in self.failing:
+                self.failing.discard(path)
+                return 404, b""
+        if path.endswith(".m3u8"):
+            return 200, self.playlist()
+        return 200, path.rsplit("/", 1)[1].encode() + b";"
+
+
+def segments_in(path):
+    with open(path, "rb") as f:
+        return f.read().decode().rstrip(";").split(";")
+
+
+def test_records_every_segment_once(serve, tmp_path):
+    base, _ = serve(LiveServer())
+    output = str(tmp_path / "live.ts")
+    stats = record_live(base + "/live/index.m3u8?__gda__=1_x", output, 2, sleep=lambda seconds: None)
+    assert segments_in(output) == [f"seg{sequence}.ts" for sequence in range(8)]
+    assert stats["missed"] == 0 and stats["errors"] == 0
+
+
+def test_failed_poll_and_segment_do_not_end_the_recording(serve, tmp_path):
+    base, _ = serve(LiveServer(failing={"/live/index.m3u8", "/live/seg4.ts"}))
+    output = str(tmp_path / "live.ts")
+    stats = record_live(base + "/live/index.m3u8", output, 1, sleep=lambda seconds: None)
+    assert segments_in(output) == [f"seg{sequence}.ts" for sequence in range(8)]
+    assert stats["errors"] == 2
+
+
+def test_existing_output_needs_resume(serve, tmp_path):
+    base, _ = serve(LiveServer(total=4))
+    output = str(tmp_path / "live.ts")
+    record_live(base + "/live/index.m3u8", output, 1, sleep=lambda seconds: None)
+    with pytest.raises(FileExistsError):
+        record_live(base + "/live/index.m3u8", output, 1, sleep=lambda seconds: None)
+
+    # Resuming picks up after the last written sequence: nothing is written twice
+    base, _ = serve(LiveServer(total=6))
+    record_live(base + "/live/index.m3u8", output, 1, sleep=lambda seconds: None, resume=True)
+    assert segments_in(output) == [f"seg{sequence}.ts" for sequence in range(6)]
+    assert os.path.exists(output + ".sequence")
@@ -0,0 +1,52 @@
+import glob
+import os
+
+from subtitles import apply_passes, beautify_timecodes, parse_subtitles, read_subtitles
+
+
+def test_empty_cue_does_not_swallow_the_next_one():
+    table = parse_subtitles("1\n00:00:01,000 --> 00:00:02,000\n\n"
+                            "2\n00:00:03,000 --> 00:00:04,000\nhello\n\n")
+    assert list(table) == [(1000, 2000, ""), (3000, 4000, "hello")]
+
+
+def test_empty_cue_at_the_end():
+    table = parse_subtitles("1\n00:00:01,000 --> 00:00:02,000\nhi\n\n2\n00:00:03,000 --> 00:00:04,000\n")
+    assert list(table) == [(1000, 2000, "hi"), (3000, 4000, "")]
+
+
+def test_multiline_text_and_vtt():
+    table = parse_subtitles("WEBVTT\n\nNOTE skipped\n\n"
+                            "00:01.500 --> 00:02.000 align:start\nfirst\nsecond\n\n"
+                            "01:00:00.000 --> 01:00:01.250\r\nlast")
+    assert list(table) == [(1500, 2000, "first\nsecond"), (3600000, 3601250, "last")]
+
+
+def test_archive_files_parse():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for path in glob.glob(os.path.join(root, "archive-subtitle", "*.srt"))[:5]:
+        assert len(read_subtitles(path)) > 0
+
+
+def _bad_cues(cues):
+    cues = list(cues)
+    return [(cue, after) for cue, after in zip(cues, cues[1:] + [None])
+            if cue[1] - cue[0] < 33 or (after is not None and (cue[1] > after[0] or after[0] < cue[0]))]
+
+
+def test_passes_handle_out_of_order_and_overlapping_cues():
+    table = parse_subtitles("1\n00:12:52,000 --> 00:12:54,000\nsecond line\n\n"
+                            "2\n00:12:51,500 --> 00:12:53,000\nDon't keep seducing me.\n\n"
+                            "3\n00:12:53,900 --> 00:12:56,000\nthird line\n\n"
+                            "4\n00:12:53,910 --> 00:12:57,000\nstarts with the third\n\n")
+    result = list(apply_passes(table, (beautify_timecodes(),)))
+    assert [text for _, _, text in result] == ["Don't keep seducing me.", "second line", "third line",
+                                               "starts with the third"]
+    assert _bad_cues(result) == []
+    assert _bad_cues(apply_passes(table)) == []
+
+
+def test_archive_files_have_no_overlaps_after_the_passes():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for path in glob.glob(os.path.join(root, "archive-subtitle", "*.srt")):
+        assert _bad_cues(apply_passes(read_subtitles(path))) == [], path
@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+from transcribe_parallel import default_workers
+
+
+@pytest.mark.parametrize("model, gb", [("large-v3-turbo", 6), ("turbo", 6), ("large-v3", 10), ("medium.en", 5),
+                                       ("unknown", 10), (None, 10)])
+def test_default_workers_uses_the_longest_model_prefix(monkeypatch, model, gb):
+    # 18 GB free, 64 cores: only the model size limits the count (3 turbo or medium models, 1 large)
+    monkeypatch.setattr(os, "cpu_count", lambda: 64)
+    monkeypatch.setattr(os, "sysconf", lambda name: 18 * 10 ** 6 if name == "SC_AVPHYS_PAGES" else 1000)
+    assert default_workers(model) == 18 // gb
@@ -0,0 +1,40 @@
+from subtitles import read_subtitles, write_subtitles
+from translate_cache import StubTranslator, TranslationCache, translate_table
+
+LINES = ["안녕하세요", "고마워요", "안녕하세요", "고마워요  ", "사랑해요", "안녕하세요"]
+
+
+class RecordingTranslator(StubTranslator):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def translate_batch(self, texts, source, target):
+        self.sent += texts
+        return super().translate_batch(texts, source, target)
+
+
+def translate_file(path, output, cache_path):
+    backend = RecordingTranslator()
+    cache = TranslationCache(str(cache_path))
+    try:
+        write_subtitles(translate_table(read_subtitles(str(path)), backend, cache, batch_size=2), str(output))
+    finally:
+        cache.close()
+    return backend
+
+
+def test_repeated_lines_reach_the_backend_once_and_a_rerun_sends_nothing(tmp_path):
+    path = tmp_path / "live_ko_KR_user.srt"
+    path.write_text("".join(f"{number}\n00:00:{number:02d},000 --> 00:00:{number:02d},900\n{line}\n\n"
+                            for number, line in enumerate(LINES, 1)), encoding="utf-8")
+    cache_path = tmp_path / "translations.sqlite"
+
+    first = translate_file(path, tmp_path / "first.srt", cache_path)
+    assert sorted(first.sent) == sorted(["안녕하세요", "고마워요", "사랑해요"])
+
+    second = translate_file(path, tmp_path / "second.srt", cache_path)
+    assert (second.calls, second.sent) == (0, [])
+    translated = (tmp_path / "second.srt").read_text(encoding="utf-8")
+    assert translated == (tmp_path / "first.srt").read_text(encoding="utf-8")
+    assert translated.count("[en] 안녕하세요") == 3
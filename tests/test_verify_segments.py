@@ -0,0 +1,105 @@
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from verify_segments import PACKET_SIZE, merge_scans, scan_ts, stream_seconds, verify_mp4, walk_boxes
+
+PID = 0x100
+FRAME = 3000    # 1/30 s in 90 kHz ticks
+
+
+def pes_timestamp(ticks):
+    return bytes([0x21 | (ticks >> 29) & 0x0E, ticks >> 22 & 0xFF, 0x01 | (ticks >> 14) & 0xFE,
+                  ticks >> 7 & 0xFF, 0x01 | (ticks << 1) & 0xFE])
+
+
+def packet(cc, dts=None):
+    # Payload-only packet on PID; with dts it starts a video PES carrying that PTS
+    header = bytes([0x47, (0x40 if dts is not None else 0) | PID >> 8, PID & 0xFF, 0x10 | cc & 0x0F])
+    payload = b"" if dts is None else b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + pes_timestamp(dts)
+    return (header + payload).ljust(PACKET_SIZE, b"\xff")
+
+
+def stream(frames, packets_per_frame=3):
+    packets = []
+    for frame in range(frames):
+        for number in range(packets_per_frame):
+            packets.append(packet(len(packets), frame * FRAME if number == 0 else None))
+    return packets
+
+
+def scan(data, *bounds):
+    bounds = (0,) + bounds + (len(data),)
+    return merge_scans([scan_ts(data, start, end) for start, end in zip(bounds, bounds[1:])])
+
+
+def test_clean_stream():
+    data = b"".join(stream(60))
+    result = scan(data)
+    assert result["errors"] == []
+    assert result["packets"] == 180
+    assert stream_seconds(result) == pytest.approx(2.0)
+
+
+def test_dropped_packet_is_a_counter_jump():
+    packets = stream(60)
+    del packets[100]
+    result = scan(b"".join(packets))
+    assert [message for _, message, _, _ in result["errors"]] == [f"continuity counter jump on PID {PID} (3 -> 5)"]
+    assert result["errors"][0][0] == 100 * PACKET_SIZE
+
+
+def test_cut_packet_loses_sync_and_resumes():
+    packets = stream(60)
+    packets[90] = packets[90][:100]
+    result = scan(b"".join(packets))
+    assert any("lost sync byte" in message for _, message, _, _ in result["errors"])
+    # Scanning picks up again at the next whole packet
+    assert result["packets"] >= 178
+    assert stream_seconds(result) == pytest.approx(2.0)
+
+
+def test_scan_split_at_a_chunk_boundary_matches_one_scan():
+    data = b"".join(stream(60))
+    whole = scan(data)
+    split = scan(data, 77 * PACKET_SIZE, 150 * PACKET_SIZE)
+    assert split["errors"] == whole["errors"] == []
+    assert split["packets"] == whole["packets"]
+    assert stream_seconds(split) == stream_seconds(whole)
+
+
+def test_packet_dropped_at_a_chunk_boundary_is_found_by_the_merge():
+    packets = stream(60)
+    del packets[77]
+    result = scan(b"".join(packets), 77 * PACKET_SIZE)
+    assert [(offset, message) for offset, message, _, _ in result["errors"]] == \
+        [(77 * PACKET_SIZE, f"continuity counter jump on PID {PID} (12 -> 14)")]
+
+
+def box(kind, body):
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def mp4(seconds, timescale=1000):
+    mvhd = box(b"mvhd", bytes(4) + struct.pack(">III", 0, 0, timescale) + struct.pack(">I", seconds * timescale)
+               + bytes(80))
+    return box(b"ftyp", b"isom" + bytes(4)) + box(b"moov", mvhd) + box(b"mdat", bytes(5000))
+
+
+def test_complete_mp4_matches_the_playlist(tmp_path):
+    path = tmp_path / "output.mp4"
+    path.write_bytes(mp4(120))
+    assert [kind for kind, _, _, _ in walk_boxes(path.read_bytes())] == ["ftyp", "moov", "mdat"]
+    playlist = SimpleNamespace(target_duration=2, total_duration=119.5)
+    assert verify_mp4(str(path), playlist) == ([], 120.0)
+
+
+def test_truncated_mp4(tmp_path):
+    path = tmp_path / "output.mp4"
+    path.write_bytes(mp4(120)[:-1000])
+    with pytest.raises(ValueError, match="mdat box at byte"):
+        list(walk_boxes(path.read_bytes()))
+    problems, seconds = verify_mp4(str(path), SimpleNamespace(target_duration=2, total_duration=120))
+    assert seconds is None
+    assert len(problems) == 1 and "runs past the end of the file" in problems[0]
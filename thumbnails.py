@@ -0,0 +1,136 @@
+'''file pipeline:
+thumbnails.py (README step 6, instead of screenshots by hand)
+    ffmpeg -skip_frame nokey: decode keyframes only, 64x36 RGB
+    score: sharpness, brightness, skin-tone (faces), optional chat spikes (chat_index.py)
+    top N, at least --min-distance seconds apart
+    ffmpeg: full-size frame + title (180px, Y -360) + "ENG SUB ON" (90px, X -640, Y +360)
+
+usage:
+    python thumbnails.py output_mp4_2024_October_11.mp4 --title "..." [--top 5] [--chat live_chat.ndjson]
+'''
+
+
+# Imports
+import argparse
+import re
+import subprocess
+
+from chat_index import ChatIndex, read_messages
+
+
+SAMPLE_WIDTH = 64
+SAMPLE_HEIGHT = 36
+PTS_TIME_RE = re.compile(r"pts_time:\s*([\d.]+)")
+
+
+def sample_keyframes(mp4_path):
+    # Returns [(seconds, rgb24 bytes)] for every keyframe; non-keyframes are never decoded
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "info", "-skip_frame", "nokey", "-i", mp4_path,
+         "-an", "-vsync", "0", "-vf", f"scale={SAMPLE_WIDTH}:{SAMPLE_HEIGHT},showinfo",
+         "-pix_fmt", "rgb24", "-f", "rawvideo", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+    )
+    times = [float(value) for value in PTS_TIME_RE.findall(result.stderr.decode("utf-8", "replace"))]
+    frame_size = SAMPLE_WIDTH * SAMPLE_HEIGHT * 3
+    frames = [result.stdout[i:i + frame_size] for i in range(0, len(result.stdout) - frame_size + 1, frame_size)]
+    return list(zip(times, frames))
+
+
+def score_frame(rgb):
+    red, green, blue = rgb[0::3], rgb[1::3], rgb[2::3]
+    luma = bytes((77 * r + 150 * g + 29 * b) >> 8 for r, g, b in zip(red, green, blue))
+    pixels = len(luma)
+
+    # Sharpness: mean difference between neighbouring pixels (blurry/motion frames score low)
+    horizontal = sum(abs(a - b) for a, b in zip(luma, luma[1:]))
+    vertical = sum(abs(a - b) for a, b in zip(luma, luma[SAMPLE_WIDTH:]))
+    sharpness = min(1.0, (horizontal + vertical) / (2 * pixels) / 24)
+
+    # Brightness: prefer well-exposed frames
+    brightness = 1 - abs(sum(luma) / pixels - 128) / 128
+
+    # Faces: share of skin-tone pixels (simple RGB rule), best around a quarter of the frame
+    skin = sum(1 for r, g, b in zip(red, green, blue)
+               if r > 95 and g > 40 and b > 20 and r > g and r > b and r - min(g, b) > 15 and r - g > 15)
+    face = min(1.0, skin / pixels * 4)
+
+    return {"sharpness": sharpness, "brightness": brightness, "face": face}
+
+
+WEIGHTS = {"sharpness": 0.4, "brightness": 0.2, "face": 0.3, "chat": 0.1}
+
+
+def rank_keyframes(keyframes, chat_index=None, top=5, min_distance=30, chat_window=30):
+    chat_peak = 1
+    if chat_index is not None:
+        chat_peak = max((count for _, count in chat_index.top_spikes(1, chat_window)), default=1) or 1
+
+    scored = []
+    for seconds, rgb in keyframes:
+        scores = score_frame(rgb)
+        if chat_index is not None:
+            around = int(seconds) - chat_window // 2
+            scores["chat"] = chat_index.count_between(around, around + chat_window) / chat_peak
+        total = sum(WEIGHTS[name] * value for name, value in scores.items())
+        scored.append((total, seconds, scores))
+
+    chosen = []
+    for total, seconds, scores in sorted(scored, key=lambda item: item[0], reverse=True):
+        if len(chosen) == top:
+            break
+        if all(abs(seconds - other) >= min_distance for _, other, _ in chosen):
+            chosen.append((total, seconds, scores))
+    return chosen
+
+
+def _drawtext_escape(text):
+    for char in ("\\", "'", ":", "%"):
+        text = text.replace(char, "\\" + char)
+    return text
+
+
+def compose_thumbnail(mp4_path, seconds, output_png, title, caption="ENG SUB ON", font=None):
+    # 1920x1080 on the thirds grid: title centred 360px above the middle,
+    # caption 640px left of and 360px below the middle, both outlined
+    font = f"fontfile='{_drawtext_escape(font)}':" if font else ""
+    filters = ["scale=1920:1080:force_original_aspect_ratio=increase", "crop=1920:1080"]
+    if title:
+        filters.append(f"drawtext={font}text='{_drawtext_escape(title)}':fontsize=180:fontcolor=white:"
+                       "borderw=6:bordercolor=black:x=(w-text_w)/2:y=(h-text_h)/2-360")
+    if caption:
+        filters.append(f"drawtext={font}text='{_drawtext_escape(caption)}':fontsize=90:fontcolor=white:"
+                       "borderw=4:bordercolor=black:x=(w-text_w)/2-640:y=(h-text_h)/2+360")
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-ss", f"{seconds:.3f}", "-i", mp4_path,
+                    "-frames:v", "1", "-vf", ",".join(filters), output_png], check=True)
+    return output_png
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick and compose thumbnail candidates from a downloaded .mp4")
+    parser.add_argument("mp4")
+    parser.add_argument("--title", default="")
+    parser.add_argument("--caption", default="ENG SUB ON")
+    parser.add_argument("--font", help="font file for the title and caption")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--min-distance", type=float, default=30, help="seconds between candidates")
+    parser.add_argument("--chat", help="live_chat.ndjson, favours frames near chat spikes")
+    parser.add_argument("--prefix", default="thumbnail")
+    args = parser.parse_args()
+
+    keyframes = sample_keyframes(args.mp4)
+    chat_index = ChatIndex(read_messages(args.chat)) if args.chat else None
+    candidates = rank_keyframes(keyframes, chat_index, args.top, args.min_distance)
+    print(f"\n-----> {len(keyframes)} keyframes scored")
+
+    for number, (total, seconds, scores) in enumerate(candidates, 1):
+        minutes, second = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        output_png = f"{args.prefix}_{number:02d}_{hours:02d}-{minutes:02d}-{second:02d}.png"
+        compose_thumbnail(args.mp4, seconds, output_png, args.title, args.caption, args.font)
+        details = ", ".join(f"{name} {value:.2f}" for name, value in scores.items())
+        print(f"\n-----> {output_png} created (score {total:.2f}: {details})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+'''file pipeline:
+transcribe_parallel.py (replaces splitting the .mp3 into _1/_2/_3 by hand)
+    ffmpeg silencedetect (find quiet points)
+    split at the silence closest to every --piece-minutes
+    N worker processes, one transcriber each (audio_chunker.decode_pcm per piece)
+        default N: as many models as fit in free memory, at most 4, each with cores / N torch threads
+    merge: global timestamps, boundary duplicates dropped, cues renumbered
+    .srt + .run.json (model, wall seconds, audio seconds for compare_transcripts.py)
+
+usage:
+    python transcribe_parallel.py output_mp3_2024_October_20.mp3 [--workers 4] [--model large-v3]
+'''
+
+
+# Imports
+import argparse
+import json
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from audio_chunker import SAMPLE_RATE, WhisperTranscriber, decode_pcm
+from subtitles import write_srt
+
+
+SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+DURATION_RE = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+
+
+def detect_silences(audio_path, noise_db=-35, min_silence=0.5):
+    # Returns the audio duration and [(silence_start, silence_end), ...] in seconds
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-i", audio_path, "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+         "-f", "null", "-"],
+        stderr=subprocess.PIPE, text=True, check=True,
+    )
+    hours, minutes, seconds = DURATION_RE.search(result.stderr).groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    silences = []
+    start = None
+    for kind, value in SILENCE_RE.findall(result.stderr):
+        if kind == "start":
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return duration, silences
+
+
+def split_points(duration, silences, piece_seconds=600):
+    # Cut near every piece_seconds, in the middle of the closest silence if there is one
+    # within a quarter piece; otherwise cut at the target itself
+    boundaries = [0.0]
+    middles = [(start + end) / 2 for start, end in silences]
+    target = piece_seconds
+    while target < duration - piece_seconds / 4:
+        near = [middle for middle in middles if abs(middle - target) <= piece_seconds / 4 and middle > boundaries[-1]]
+        cut = min(near, key=lambda middle: abs(middle - target)) if near else target
+        boundaries.append(cut)
+        target = cut + piece_seconds
+    boundaries.append(duration)
+    return boundaries
+
+
+# Worker processes: the transcriber (a model) is built once per process.
+# Every process holds a full model, and torch uses all cores per process unless told otherwise
+
+# Approximate memory per loaded Whisper model in GB (openai-whisper README), matched by longest name prefix
+MODEL_MEMORY_GB = {"tiny": 1, "base": 1, "small": 2, "medium": 5, "large": 10, "large-v3-turbo": 6, "turbo": 6}
+MAX_DEFAULT_WORKERS = 4
+
+
+def default_workers(model=None):
+    cores = os.cpu_count() or 1
+    names = [name for name in MODEL_MEMORY_GB if model and model.startswith(name)]
+    model_gb = MODEL_MEMORY_GB[max(names, key=len)] if names else 10
+    try:
+        free_gb = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1e9
+    except (AttributeError, ValueError, OSError):
+        free_gb = model_gb     # unknown (Windows): one model
+    return max(1, min(MAX_DEFAULT_WORKERS, cores // 2, int(free_gb // model_gb)))
+
+
+_transcriber = None
+
+
+def _init_worker(factory, factory_args, threads):
+    global _transcriber
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _transcriber = factory(*factory_args)
+
+
+def _transcribe_piece(audio_path, start, end):
+    pcm = decode_pcm(audio_path, start, end - start)
+    offset_ms = int(start * 1000)
+    return [(offset_ms + int(cue_start * 1000), offset_ms + int(cue_end * 1000), text.strip())
+            for cue_start, cue_end, text in _transcriber.transcribe(pcm, SAMPLE_RATE) if text.strip()]
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+def merge_pieces(pieces, boundaries, window_ms=3000, lookback=3):
+    # pieces: cue lists in piece order, each already in global time.
+    # A cue right after a boundary that repeats one of the last cues before it is dropped,
+    # and cues never overlap the next piece's first cue
+    merged = []
+    for number, cues in enumerate(pieces):
+        boundary_ms = int(boundaries[number] * 1000)
+        recent = {_normalize(text) for _, _, text in merged[-lookback:]}
+        for start_ms, end_ms, text in cues:
+            if start_ms - boundary_ms < window_ms and _normalize(text) in recent:
+                continue
+            if merged and merged[-1][1] > start_ms:
+                merged[-1] = (merged[-1][0], max(merged[-1][0], start_ms), merged[-1][2])
+            merged.append((start_ms, end_ms, text))
+    return merged
+
+
+def transcribe_parallel(audio_path, output_srt, workers=None, piece_seconds=600,
+                        factory=WhisperTranscriber, factory_args=()):
+    model = factory_args[0] if factory_args else None
+    workers = workers or default_workers(model)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    wall_start = time.perf_counter()
+    duration, silences = detect_silences(audio_path)
+    boundaries = split_points(duration, silences, piece_seconds)
+    print(f"\n-----> {len(boundaries) - 1} pieces, {workers} workers x {threads} threads")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(factory, factory_args, threads)) as executor:
+        pieces = list(executor.map(_transcribe_piece, [audio_path] * (len(boundaries) - 1),
+                                   boundaries[:-1], boundaries[1:]))
+    seconds = time.perf_counter() - start
+
+    cues = merge_pieces(pieces, boundaries)
+    write_srt(cues, output_srt)
+    print(f"\n-----> {output_srt}: {len(cues)} cues, {duration / 60:.0f} min of audio in {seconds:.0f} s "
+          f"({duration / max(seconds, 1e-9):.1f}x realtime)")
+
+    # Cost of the run next to the .srt, read by compare_transcripts.py
+    with open(os.path.splitext(output_srt)[0] + ".run.json", "w", encoding="utf-8") as f:
+        json.dump({"model": model, "wall_seconds": round(time.perf_counter() - wall_start, 1),
+                   "audio_seconds": round(duration, 1)}, f, indent=4)
+    return cues
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe an .mp3 with several worker processes")
+    parser.add_argument("audio")
+    parser.add_argument("--output", help="default: <audio>.srt")
+    parser.add_argument("--workers", type=int, help="default: as many models as fit in free memory, at most 4")
+    parser.add_argument("--piece-minutes", type=float, default=10)
+    parser.add_argument("--model", default="large-v3")
+    parser.add_argument("--language")
+    args = parser.parse_args()
+
+    output_srt = args.output or os.path.splitext(args.audio)[0] + ".srt"
+    transcribe_parallel(args.audio, output_srt, args.workers, args.piece_minutes * 60,
+                        WhisperTranscriber, (args.model, args.language))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+'''file pipeline:
+translate_cache.py (ko .vtt -> en .vtt, e.g. _ko_KR_user.vtt -> _ko_KR_user_to_en.vtt)
+    subtitles.py (read, distinct lines only)
+    SQLite cache keyed by backend, languages, context and normalized line
+    only lines missing from the cache go to the backend, in batches
+    LRU eviction above --max-entries
+    subtitles.py (write)
+
+usage:
+    python translate_cache.py 25oct2024-yunjin-live_ko_KR_user.vtt [--backend google] [--context lesserafim]
+'''
+
+
+# Imports
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+import unicodedata
+
+from subtitles import CueTable, read_subtitles, write_subtitles
+
+
+# Backends: anything with a name and translate_batch(texts, source, target) -> [translation, ...]
+
+class StubTranslator:
+    # Local stand-in for tests and dry runs: tags every line and counts what it was sent
+    name = "stub"
+
+    def __init__(self):
+        self.calls = 0
+        self.lines = 0
+
+    def translate_batch(self, texts, source, target):
+        self.calls += 1
+        self.lines += len(texts)
+        return [f"[{target}] {text}" for text in texts]
+
+
+class GoogleTranslator:
+    name = "google"
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    def translate_batch(self, texts, source, target):
+        return [result.text for result in self.translator.translate(list(texts), src=source, dest=target)]
+
+
+BACKENDS = {"stub": StubTranslator, "google": GoogleTranslator}
+
+
+def normalize_source(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class TranslationCache:
+    def __init__(self, path="translations.sqlite", max_entries=200_000):
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS translations (
+            key TEXT PRIMARY KEY, source TEXT NOT NULL, translation TEXT NOT NULL, last_used INTEGER NOT NULL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(backend_name, source, target, context, normalized):
+        return hashlib.sha256("\0".join((backend_name, source, target, context, normalized)).encode()).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self.db.execute(
+                f"SELECT key, translation FROM translations WHERE key IN ({placeholders})", chunk))
+            self.db.execute(f"UPDATE translations SET last_used = ? WHERE key IN ({placeholders})",
+                            [time.time_ns()] + chunk)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, rows):
+        # rows: (key, normalized source, translation)
+        now = time.time_ns()
+        self.db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                            [(key, source, translation, now) for key, source, translation in rows])
+
+    def evict(self):
+        (count,) = self.db.execute("SELECT COUNT(*) FROM translations").fetchone()
+        if count > self.max_entries:
+            self.db.execute("DELETE FROM translations WHERE key IN "
+                            "(SELECT key FROM translations ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+
+    def close(self):
+        self.evict()
+        self.db.commit()
+        self.db.close()
+
+
+def translate_texts(texts, backend, cache, source="ko", target="en", context="", batch_size=50):
+    # Each distinct normalized line is looked up once and sent to the backend at most once
+    normalized = [normalize_source(text) for text in texts]
+    keys = {line: cache.key(backend.name, source, target, context, line) for line in set(normalized) if line}
+    found = cache.get_many(keys.values())
+    translations = {line: found.get(key) for line, key in keys.items()}
+
+    missing = [line for line, translation in translations.items() if translation is None]
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        results = backend.translate_batch(batch, source, target)
+        cache.put_many([(keys[line], line, result) for line, result in zip(batch, results)])
+        translations.update(zip(batch, results))
+    cache.db.commit()
+
+    return [translations.get(line, "") for line in normalized]
+
+
+def translate_table(table, backend, cache, source="ko", target="en", context="", batch_size=50):
+    # CueTable texts are already distinct, so translate the pool and remap the ids
+    used = sorted(set(table.text_ids))
+    translated = translate_texts([table.texts[text_id] for text_id in used], backend, cache,
+                                 source, target, context, batch_size)
+    by_id = dict(zip(used, translated))
+
+    result = CueTable()
+    for start_ms, end_ms, text_id in table.rows():
+        result.add(start_ms, end_ms, by_id[text_id])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate .srt / .vtt with a persistent line cache")
+    parser.add_argument("input")
+    parser.add_argument("output", nargs="?", help="default: <input>_to_<target>.<ext>")
+    parser.add_argument("--source", default="ko")
+    parser.add_argument("--target", default="en")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="google")
+    parser.add_argument("--context", default="", help="kept apart in the cache, e.g. a glossary or group name")
+    parser.add_argument("--cache", default="translations.sqlite")
+    parser.add_argument("--max-entries", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    name, extension = os.path.splitext(args.input)
+    output = args.output or f"{name}_to_{args.target}{extension}"
+
+    backend = BACKENDS[args.backend]()
+    cache = TranslationCache(args.cache, args.max_entries)
+    try:
+        table = read_subtitles(args.input)
+        write_subtitles(translate_table(table, backend, cache, args.source, args.target,
+                                        args.context, args.batch_size), output)
+    finally:
+        cache.close()
+
+    print(f"\n-----> {output} created ({len(table)} cues, {cache.hits} lines from cache, {cache.misses} translated)")
+
+
+if __name__ == "__main__":
+    main()
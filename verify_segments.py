@@ -0,0 +1,387 @@
+'''file pipeline:
+verify_segments.py (after download_segments.py / record_live.py, before uploading)
+    segment_cache/<vod_id>-*.ts or one recorded .ts -> mmap, no decoding
+        sync byte every 188 bytes, continuity counter per PID, DTS (PTS) never going back,
+        duration from the timestamps vs EXTINF
+    output .mp4 -> top-level box walk (moov/mdat complete), mvhd duration vs sum of EXTINF
+    bad segment indices -> --repair discards them from the cache and fetches only those again
+
+usage:
+    python verify_segments.py output_m3u8_<vod>.m3u8 [--ts recorded.ts] [--mp4 output.mp4] [--repair]
+'''
+
+
+# Imports
+import argparse
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+from convert_to_links import read_playlist
+from download_segments import DEFAULT_WORKERS, download_segments
+from segment_cache import SegmentCache, segment_name, vod_id_from_name
+
+
+PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+NULL_PID = 0x1FFF
+CLOCK = 90000           # PES timestamps are in 1/90000 s
+WRAP = 1 << 33          # and 33 bits wide
+MAX_GAP = CLOCK         # a DTS jumping forward by more than 1 s means missing data
+CHUNK_SIZE = 64 << 20   # a single large .ts is scanned in chunks of this size, one per process
+
+
+def _timestamp(data, offset):
+    # 5-byte PES timestamp with marker bits
+    return (((data[offset] >> 1) & 0x07) << 30 | data[offset + 1] << 22 | (data[offset + 2] >> 1) << 15
+            | data[offset + 3] << 7 | data[offset + 4] >> 1)
+
+
+def _ticks(later, earlier):
+    # Signed distance between two timestamps, across the 33-bit wrap
+    delta = (later - earlier) % WRAP
+    return delta - WRAP if delta >= WRAP // 2 else delta
+
+
+# Scan of MPEG-TS packets starting in [start, end). The header bytes of every packet are read with
+# strided slices of the mmap (one C-level copy each), so Python only touches 4 bytes per packet:
+#   errors:  [(byte offset, message, last DTS seen or None, DTS after a gap or None)]
+#   first:   {pid: [cc, dts]} of the first payload packet / timestamp in the range
+#   last:    {pid: [cc, dts, dts delta, timestamps]} at the end of the range
+# first/last let ranges scanned in parallel be joined with the same checks (merge_scans)
+
+def _resync(data, position, end):
+    # Next offset where three packets in a row start with the sync byte
+    position = data.find(b"\x47", position, end)
+    while position != -1:
+        if all(data[ahead] == SYNC_BYTE for ahead in (position + PACKET_SIZE, position + 2 * PACKET_SIZE)
+               if ahead < len(data)):
+            return position
+        position = data.find(b"\x47", position + 1, end)
+    return None
+
+
+def _scan_packets(data, start, stop, scan):
+    errors, first, last = scan["errors"], scan["first"], scan["last"]
+    clock = scan["clock"]
+    # expected[pid]: the 4th header byte of the next plain packet (payload only, counter + 1).
+    # Plain packets without unit start are the bulk of the stream and take the first branch only
+    expected = {pid: 0x10 | (state[0] + 1) & 0x0F for pid, state in last.items()}
+    headers = zip(data[start + 1:stop:PACKET_SIZE], data[start + 2:stop:PACKET_SIZE], data[start + 3:stop:PACKET_SIZE])
+    for number, (h1, h2, h3) in enumerate(headers):
+        key = h1 << 8 | h2
+        if expected.get(key) == h3:
+            expected[key] = 0x10 | (h3 + 1) & 0x0F
+            continue
+
+        pid = key & 0x1FFF
+        if pid == NULL_PID or not h3 & 0x10:
+            continue    # no payload: the continuity counter does not advance
+        offset = start + number * PACKET_SIZE
+        payload = offset + 4
+        if h3 & 0x20:
+            length = data[payload]
+            if length and data[payload + 1] & 0x80:
+                last.pop(pid, None)     # discontinuity_indicator: counter and clock restart
+                expected.pop(pid, None)
+            payload += 1 + length
+
+        cc = h3 & 0x0F
+        jump = None
+        state = last.get(pid)
+        if state is None:
+            state = last[pid] = [cc, None, 0, 0]
+            first.setdefault(pid, [cc, None])
+        elif cc != expected[pid] & 0x0F and cc != (expected[pid] - 1) & 0x0F:
+            jump = (offset, f"continuity counter jump on PID {pid} ({(expected[pid] - 1) & 0x0F} -> {cc})", clock, None)
+        expected[pid] = 0x10 | (cc + 1) & 0x0F
+
+        # PES header at the start of a unit: 00 00 01, stream id, flags, PTS [DTS]
+        if h1 & 0x40 and data[payload:payload + 3] == b"\x00\x00\x01" and 0xC0 <= data[payload + 3] <= 0xEF \
+                and data[payload + 7] & 0x80:
+            dts = _timestamp(data, payload + (14 if data[payload + 7] & 0x40 else 9))
+            if state[1] is not None:
+                delta = _ticks(dts, state[1])
+                if delta < 0:
+                    errors.append((offset, f"timestamp going back on PID {pid} ({delta / CLOCK:.3f} s)", clock, None))
+                elif delta > MAX_GAP:
+                    # The counter jump at the same packet is the same hole
+                    jump = (offset, f"{delta / CLOCK:.2f} s gap on PID {pid}", state[1], dts)
+                else:
+                    state[2] = delta
+            elif first[pid][1] is None:
+                first[pid][1] = dts
+            state[1] = dts
+            state[3] += 1
+            clock = dts
+        if jump is not None:
+            errors.append(jump)
+
+    for pid, state in last.items():
+        state[0] = (expected[pid] - 1) & 0x0F
+    scan["clock"] = clock
+
+
+def scan_ts(data, start=0, end=None):
+    size = len(data)
+    end = size if end is None else end
+    scan = {"start": start, "packets": 0, "errors": [], "first": {}, "last": {}, "clock": None}
+
+    position = start
+    if start and start < size and data[start] != SYNC_BYTE:
+        # The previous range's last packet runs into this one (a shifted recording), not an error
+        position = _resync(data, start, end)
+    while position is not None and position < end:
+        packets = min((end - position + PACKET_SIZE - 1) // PACKET_SIZE, (size - position) // PACKET_SIZE)
+        synced = data[position:position + packets * PACKET_SIZE:PACKET_SIZE]
+        good = packets - len(synced.lstrip(b"\x47"))
+        stop = position + good * PACKET_SIZE
+        _scan_packets(data, position, stop, scan)
+        scan["packets"] += good
+        if good < packets:
+            scan["errors"].append((stop, "lost sync byte (truncated or corrupt packet)", scan["clock"], None))
+            # The packet before the bad sync byte is usually the cut one: look for the next packet inside it
+            position = _resync(data, max(position, stop - PACKET_SIZE) + 1, end)
+        elif stop < end:
+            scan["errors"].append((stop, f"truncated packet ({size - stop} trailing bytes)", scan["clock"], None))
+            break
+        else:
+            position = stop
+    return scan
+
+
+def merge_scans(scans):
+    # Joins consecutive range scans as if the whole file had been scanned at once;
+    # first becomes {pid: first dts}
+    merged = {"packets": 0, "errors": [], "first": {}, "last": {}}
+    for scan in scans:
+        merged["packets"] += scan["packets"]
+        merged["errors"] += scan["errors"]
+        for pid, (cc, dts) in scan["first"].items():
+            previous = merged["last"].get(pid)
+            if previous is not None:
+                delta = None if dts is None or previous[1] is None else _ticks(dts, previous[1])
+                if delta is not None and delta < 0:
+                    merged["errors"].append((scan["start"], f"timestamp going back on PID {pid}", previous[1], None))
+                elif delta is not None and delta > MAX_GAP:
+                    merged["errors"].append((scan["start"], f"{delta / CLOCK:.2f} s gap on PID {pid}", previous[1], dts))
+                elif cc not in (previous[0], (previous[0] + 1) & 0x0F):
+                    merged["errors"].append((scan["start"], f"continuity counter jump on PID {pid} "
+                                                            f"({previous[0]} -> {cc})", previous[1], None))
+            if merged["first"].get(pid) is None:
+                merged["first"][pid] = dts
+        for pid, state in scan["last"].items():
+            previous = merged["last"].get(pid)
+            if previous is not None:
+                if state[1] is None:
+                    state[1], state[2] = previous[1], previous[2]
+                state[3] += previous[3]
+            merged["last"][pid] = state
+    merged["errors"].sort(key=lambda error: error[0])
+    return merged
+
+
+def stream_seconds(scan):
+    # Longest PID timeline: first to last DTS plus one frame
+    seconds = 0.0
+    for pid, state in scan["last"].items():
+        first = scan["first"].get(pid)
+        if first is not None and state[1] is not None:
+            seconds = max(seconds, (_ticks(state[1], first) + state[2]) / CLOCK)
+    return seconds
+
+
+def _scan_file(path, start=0, end=None):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return scan_ts(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return scan_ts(data, start, end)
+
+
+# Segments in the cache: one process scans many files, each checked against its own EXTINF
+
+def _check_segment(path, extinf, tolerance):
+    scan = merge_scans([_scan_file(path)])
+    problems = [error[1] for error in scan["errors"]]
+    seconds = stream_seconds(scan)
+    if abs(seconds - extinf) > tolerance:
+        problems.append(f"{seconds:.2f} s of timestamps, EXTINF says {extinf:.2f} s")
+    return problems, seconds
+
+
+def verify_cached_segments(playlist, cache, workers=None, tolerance=0.5):
+    # Returns ({segment index: [problems]}, seconds found in the segments)
+    bad = {}
+    jobs = []
+    for index, uri in enumerate(playlist.uris):
+        name = segment_name(uri)
+        if name not in cache:
+            bad[index] = ["missing from the cache"]
+        else:
+            jobs.append((index, cache.path(name), playlist.durations[index]))
+
+    seconds = 0.0
+    with ProcessPoolExecutor(workers) as executor:
+        results = executor.map(_check_segment, [job[1] for job in jobs], [job[2] for job in jobs],
+                               [tolerance] * len(jobs), chunksize=64)
+        for (index, _, _), (problems, segment_seconds) in zip(jobs, results):
+            seconds += segment_seconds
+            if problems:
+                bad[index] = problems
+    return bad, seconds
+
+
+# One recorded / concatenated .ts: scanned in chunks in parallel, errors mapped back to segments
+# through their timestamps and the EXTINF running total
+
+def verify_ts_file(path, playlist=None, workers=None, tolerance=None):
+    size = os.path.getsize(path)
+    chunk = CHUNK_SIZE - CHUNK_SIZE % PACKET_SIZE
+    starts = list(range(0, size, chunk)) or [0]
+    ends = starts[1:] + [size]
+    with ProcessPoolExecutor(workers) as executor:
+        scan = merge_scans(list(executor.map(_scan_file, [path] * len(starts), starts, ends)))
+
+    seconds = stream_seconds(scan)
+    bad = {}
+    if playlist is None:
+        return scan, seconds, bad
+
+    boundaries = list(accumulate(playlist.durations))
+    base = min((dts for dts in scan["first"].values() if dts is not None), default=None)
+
+    def segment_at(clock):
+        return min(len(playlist) - 1, bisect_right(boundaries, _ticks(clock, base) / CLOCK))
+
+    for offset, message, clock, until in scan["errors"]:
+        if clock is None or base is None:
+            indices = [min(len(playlist) - 1, int(offset / size * len(playlist))) if size else 0]
+        elif until is not None:
+            # Segments that lie completely inside the gap are missing; a partial gap blames where it starts
+            indices = list(range(segment_at(clock) + 1, segment_at(until))) or [segment_at(clock)]
+        else:
+            indices = [segment_at(clock)]
+        for index in indices:
+            bad.setdefault(index, []).append(f"byte {offset}: {message}")
+
+    # The file ends early: every segment after the last timestamp is missing
+    tolerance = tolerance if tolerance is not None else max(playlist.target_duration, 1)
+    if playlist.total_duration - seconds > tolerance:
+        for index in range(bisect_right(boundaries, seconds), len(playlist)):
+            bad.setdefault(index, []).append("missing (stream ends early)")
+    return scan, seconds, bad
+
+
+# .mp4: walk the top-level boxes without reading the media data
+
+def walk_boxes(data, start=0, end=None):
+    # Yields (type, offset, header size, box size); raises ValueError if a box runs past the end
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size, = struct.unpack_from(">Q", data, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ValueError(f"{kind.decode('latin-1')} box at byte {offset} runs past the end of the file")
+        yield kind.decode("latin-1"), offset, header, size
+        offset += size
+    if offset != end:
+        raise ValueError(f"{end - offset} stray bytes at the end of the file")
+
+
+def mp4_duration(data):
+    for kind, offset, header, size in walk_boxes(data):
+        if kind != "moov":
+            continue
+        for child, child_offset, child_header, _ in walk_boxes(data, offset + header, offset + size):
+            if child == "mvhd":
+                body = child_offset + child_header
+                if data[body] == 1:
+                    timescale, duration = struct.unpack_from(">IQ", data, body + 20)
+                else:
+                    timescale, duration = struct.unpack_from(">II", data, body + 12)
+                return duration / timescale
+    return None
+
+
+def verify_mp4(path, playlist=None, tolerance=None):
+    problems = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        try:
+            kinds = {kind for kind, _, _, _ in walk_boxes(data)}
+            problems += [f"no {kind} box" for kind in ("ftyp", "moov", "mdat") if kind not in kinds]
+            seconds = mp4_duration(data) if "moov" in kinds else None
+        except ValueError as error:
+            problems.append(str(error))
+            seconds = None
+    if playlist is not None and seconds is not None:
+        tolerance = tolerance if tolerance is not None else max(playlist.target_duration, 1)
+        if abs(seconds - playlist.total_duration) > tolerance:
+            problems.append(f"{seconds:.1f} s long, playlist EXTINF total is {playlist.total_duration:.1f} s")
+    return problems, seconds
+
+
+def repair_segments(playlist, cache, indices, workers=DEFAULT_WORKERS):
+    # Drop the bad segments from the cache and fetch only those again
+    urls = [playlist.uris[index] for index in sorted(indices)]
+    for url in urls:
+        cache.discard(segment_name(url))
+
+    class Discard:
+        def write(self, data):
+            pass
+
+    return download_segments(urls, Discard(), workers, cache=cache)
+
+
+def print_bad(bad, limit=20):
+    for index in sorted(bad)[:limit]:
+        print(f"    segment {index}: {'; '.join(bad[index])}")
+    if len(bad) > limit:
+        print(f"    ... {len(bad) - limit} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check downloaded segments / .ts / .mp4 against the playlist")
+    parser.add_argument("m3u8", help="rewritten playlist (output_m3u8_*.m3u8)")
+    parser.add_argument("--cache-dir", default="segment_cache")
+    parser.add_argument("--ts", help="recorded or concatenated .ts to check instead of the cached segments")
+    parser.add_argument("--mp4", help="finished .mp4 to check")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repair", action="store_true", help="fetch bad segments again into the cache")
+    args = parser.parse_args()
+
+    playlist = read_playlist(args.m3u8)
+    print(f"\n-----> {len(playlist)} segments, {playlist.total_duration:.1f} s in the playlist")
+
+    if args.ts:
+        scan, seconds, bad = verify_ts_file(args.ts, playlist, args.workers)
+        print(f"\n-----> {args.ts}: {scan['packets']} packets, {seconds:.1f} s, {len(bad)} bad segments")
+    else:
+        cache = SegmentCache(args.cache_dir, vod_id_from_name(segment_name(playlist.uris[0])))
+        bad, seconds = verify_cached_segments(playlist, cache, args.workers)
+        print(f"\n-----> {args.cache_dir}: {seconds:.1f} s in the segments, {len(bad)} bad segments")
+    print_bad(bad)
+
+    if args.mp4:
+        problems, seconds = verify_mp4(args.mp4, playlist)
+        length = "unknown length" if seconds is None else f"{seconds:.1f} s"
+        print(f"\n-----> {args.mp4}: {length}, {'; '.join(problems) or 'ok'}")
+
+    if bad and args.repair:
+        cache = SegmentCache(args.cache_dir, vod_id_from_name(segment_name(playlist.uris[0])))
+        stats = repair_segments(playlist, cache, bad)
+        print(f"\n-----> fetched {stats['segments']} segments again, run Main.py to rebuild the outputs from the cache")
+
+
+if __name__ == "__main__":
+    main()